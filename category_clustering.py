@@ -0,0 +1,133 @@
+import os
+import numpy as np
+from data_processing_common import sanitize_filename
+from llm_utils import get_embeddings
+
+EMBEDDING_PROVIDER = os.getenv("EMBEDDING_PROVIDER", "deepinfra")
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "BAAI/bge-base-en-v1.5")
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))
+# Minimum cosine similarity between a description and a cluster centroid to join the cluster
+CLUSTER_THRESHOLD = float(os.getenv("LFO_CLUSTER_THRESHOLD", "0.8"))
+CLUSTERS_FILE_NAME = '.category_clusters.npz'
+
+def embed_texts(texts, provider=EMBEDDING_PROVIDER, model=EMBEDDING_MODEL, batch_size=EMBEDDING_BATCH_SIZE):
+    """Embed texts in batches and return an L2-normalized (n, d) float32 matrix."""
+    vectors = []
+    for start in range(0, len(texts), batch_size):
+        vectors.extend(get_embeddings(texts[start:start + batch_size], model, provider=provider))
+    matrix = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+def cluster_embeddings(matrix, centroids=None, threshold=CLUSTER_THRESHOLD, iterations=3, block_size=1024):
+    """Cluster normalized row vectors by cosine similarity.
+
+    A leader pass assigns each vector to the most similar centroid if the similarity is at
+    least `threshold` and otherwise starts a new cluster; similarities are computed a block
+    of rows at a time as one matrix product. A few spherical k-means iterations then refine
+    the new centroids. Existing `centroids` (e.g. from an earlier run) are kept fixed so
+    their clusters, and folder names, stay stable.
+
+    Returns (labels, centroids).
+    """
+    fixed = 0 if centroids is None else len(centroids)
+    centroids = np.zeros((0, matrix.shape[1]), dtype=np.float32) if centroids is None else np.asarray(centroids, dtype=np.float32)
+    labels = np.empty(len(matrix), dtype=np.int64)
+
+    for start in range(0, len(matrix), block_size):
+        block = matrix[start:start + block_size]
+        known = len(centroids)
+        if known:
+            sims = block @ centroids.T
+            best = sims.argmax(axis=1)
+            best_sim = sims[np.arange(len(block)), best]
+        else:
+            best = np.zeros(len(block), dtype=np.int64)
+            best_sim = np.full(len(block), -np.inf)
+        labels[start:start + len(block)] = best
+        # Rows without a close centroid are resolved one by one, as they may seed new clusters
+        for row in np.flatnonzero(best_sim < threshold):
+            vector = block[row]
+            if len(centroids) > known:
+                new_sims = centroids[known:] @ vector
+                candidate = int(new_sims.argmax())
+                if new_sims[candidate] >= threshold:
+                    labels[start + row] = known + candidate
+                    continue
+            labels[start + row] = len(centroids)
+            centroids = np.vstack([centroids, vector])
+
+    for _ in range(iterations):
+        if len(centroids) == fixed:
+            break
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, matrix)
+        updated = sums[fixed:]
+        norms = np.linalg.norm(updated, axis=1, keepdims=True)
+        empty = norms[:, 0] == 0
+        updated = np.where(empty[:, None], centroids[fixed:], updated / np.maximum(norms, 1e-12))
+        centroids = np.vstack([centroids[:fixed], updated])
+        sims = matrix @ centroids.T
+        new_labels = sims.argmax(axis=1)
+        if np.array_equal(new_labels, labels):
+            break
+        labels = new_labels
+    return labels, centroids
+
+def name_cluster(descriptions, text_inference):
+    """Ask the LLM once for a folder name that covers a cluster's sample descriptions."""
+    samples = '\n'.join(f"- {description[:300]}" for description in descriptions)
+    prompt = f"""The following descriptions belong to files that will be stored in the same folder.
+Generate a general category or theme that best represents all of them. This will be used as the folder name.
+Limit the category to a maximum of 2 words. Use nouns and avoid verbs. Do not use generic terms like 'untitled', 'unknown' or 'misc'.
+
+{samples}
+
+Output only the category, without any additional text.
+
+Category:"""
+    return sanitize_filename(text_inference(prompt) or '', max_words=2)
+
+def load_clusters(output_path):
+    """Load (centroids, names) saved by an earlier run, or (None, [])."""
+    path = os.path.join(output_path, CLUSTERS_FILE_NAME)
+    if not os.path.exists(path):
+        return None, []
+    with np.load(path) as saved:
+        return saved['centroids'], [str(name) for name in saved['names']]
+
+def save_clusters(output_path, centroids, names):
+    os.makedirs(output_path, exist_ok=True)
+    np.savez(os.path.join(output_path, CLUSTERS_FILE_NAME), centroids=centroids, names=np.asarray(names))
+
+def assign_cluster_categories(data_list, text_inference, output_path=None, threshold=CLUSTER_THRESHOLD, samples_per_cluster=5):
+    """Group files by the similarity of their descriptions and give each group one folder name.
+
+    Sets data['category_cluster'] on every entry with a description; compute_operations
+    uses it in place of the per-file folder name. Clusters saved in output_path by earlier
+    runs are extended, so similar files keep going into the same folders. Nothing is
+    written here: the updated (centroids, names) are returned for the caller to pass to
+    save_clusters once the operations have been executed, or (None, []) if there was
+    nothing to cluster.
+    """
+    entries = [data for data in data_list if data.get('description')]
+    if not entries:
+        return None, []
+    centroids, names = load_clusters(output_path) if output_path else (None, [])
+
+    matrix = embed_texts([data['description'] for data in entries])
+    labels, centroids = cluster_embeddings(matrix, centroids=centroids, threshold=threshold)
+
+    for cluster in range(len(names), len(centroids)):
+        members = np.flatnonzero(labels == cluster)
+        if len(members) == 0:
+            names.append('')
+            continue
+        # Name the cluster from the descriptions closest to its centroid
+        closest = members[np.argsort(-(matrix[members] @ centroids[cluster]))[:samples_per_cluster]]
+        name = name_cluster([entries[i]['description'] for i in closest], text_inference)
+        names.append(name if name != 'untitled' else entries[closest[0]]['foldername'])
+
+    for data, label in zip(entries, labels):
+        data['category_cluster'] = names[label] or data['foldername']
+    return centroids, names
@@ -1,37 +1,16 @@
 import os
-import re
+import errno
+import shutil
 import datetime  # Import datetime for date operations
+from concurrent.futures import ThreadPoolExecutor
 from rich.progress import Progress, TextColumn, BarColumn, TimeElapsedColumn
-from openai import AzureOpenAI
-
-def sanitize_filename(name, max_length=50, max_words=5):
-    """Sanitize the filename by removing unwanted words and characters."""
-    # Remove file extension if present
-    name = os.path.splitext(name)[0]
-    # Remove unwanted words and data type words
-    name = re.sub(
-        r'\b(jpg|jpeg|png|gif|bmp|txt|md|pdf|docx|xls|xlsx|csv|ppt|pptx|image|picture|photo|this|that|these|those|here|there|'
-        r'please|note|additional|notes|folder|name|sure|heres|a|an|the|and|of|in|'
-        r'to|for|on|with|your|answer|should|be|only|summary|summarize|text|category)\b',
-        '',
-        name,
-        flags=re.IGNORECASE
-    )
-    # Remove non-word characters except underscores
-    sanitized = re.sub(r'[^\w\s]', '', name).strip()
-    # Replace multiple underscores or spaces with a single underscore
-    sanitized = re.sub(r'[\s_]+', '_', sanitized)
-    # Convert to lowercase
-    sanitized = sanitized.lower()
-    # Remove leading/trailing underscores
-    sanitized = sanitized.strip('_')
-    # Split into words and limit the number of words
-    words = sanitized.split('_')
-    limited_words = [word for word in words if word]  # Remove empty strings
-    limited_words = limited_words[:max_words]
-    limited_name = '_'.join(limited_words)
-    # Limit length
-    return limited_name[:max_length] if limited_name else 'untitled'
+from link_strategy import choose_link_type, copy_fallback_allowed, FICLONE
+from filename_sanitizer import sanitize_filename  # Re-exported for callers
+from filename_sanitizer import name_byte_limit, truncate_utf8
+from run_log import log_message
+
+# Threads issuing link syscalls; mostly waiting on the filesystem, which matters on network shares
+LINK_WORKERS = int(os.getenv("LFO_LINK_WORKERS", "8"))
 
 def process_files_by_date(file_paths, output_path, dry_run=False, silent=False, log_file=None):
     """Process files to organize them by date."""
@@ -48,8 +27,8 @@ def process_files_by_date(file_paths, output_path, dry_run=False, silent=False,
         # Prepare new file path
         new_file_name = os.path.basename(file_path)
         new_file_path = os.path.join(dir_path, new_file_name)
-        # Decide whether to use hardlink or symlink
-        link_type = 'hardlink'  # Assume hardlink for now
+        # Cheapest valid way to materialize the file (hardlink, reflink, symlink or copy)
+        link_type = choose_link_type(file_path, output_path)
         # Record the operation
         operation = {
             'source': file_path,
@@ -109,8 +88,8 @@ def process_files_by_type(file_paths, output_path, dry_run=False, silent=False,
         # Prepare new file path
         new_file_name = os.path.basename(file_path)
         new_file_path = os.path.join(dir_path, new_file_name)
-        # Decide whether to use hardlink or symlink
-        link_type = 'hardlink'  # Assume hardlink for now
+        # Cheapest valid way to materialize the file (hardlink, reflink, symlink or copy)
+        link_type = choose_link_type(file_path, output_path)
         # Record the operation
         operation = {
             'source': file_path,
@@ -121,8 +100,72 @@ def process_files_by_type(file_paths, output_path, dry_run=False, silent=False,
 
     return operations
 
+class DestinationNamer:
+    """Assigns collision-free destination paths in amortized constant time per file.
+
+    Each (directory, stem, extension) keeps the next counter to try, so the thousandth
+    'untitled' file does not retry untitled_1 ... untitled_999 first. The entries already
+    present in a destination directory are listed once, the first time it is used; an
+    existing entry that already is the requested link of the same source is reused, so
+    planning over a previous output stays idempotent.
+    """
+
+    def __init__(self, reserved=(), released=()):
+        self._released = set(released)  # Paths that are about to be removed
+        self._taken = set(reserved) - self._released
+        self._existing = set()
+        self._listed = set()
+        self._next = {}
+        self._name_bytes = {}  # Filename byte limit per output root
+
+    def _list_directory(self, dir_path):
+        self._listed.add(dir_path)
+        try:
+            with os.scandir(dir_path) as entries:
+                for entry in entries:
+                    path = os.path.join(dir_path, entry.name)
+                    if path not in self._released:
+                        self._existing.add(path)
+        except OSError:
+            pass  # Not created yet
+
+    def _is_free(self, path, source, link_type):
+        if path in self._taken:
+            return False
+        return path not in self._existing or is_existing_link(source, path, link_type)
+
+    def _fit_stem(self, dir_path, stem, extension):
+        """Shorten stem so that stem_NNNNNextension fits the filesystem's filename limit."""
+        root = os.path.dirname(dir_path)
+        limit = self._name_bytes.get(root)
+        if limit is None:
+            limit = self._name_bytes[root] = name_byte_limit(root)
+        return truncate_utf8(stem, max(1, limit - len(extension.encode('utf-8')) - 6)) or stem
+
+    def reserve(self, dir_path, stem, extension, source, link_type):
+        """Return a free path dir_path/stem[_N]extension for source and mark it as taken."""
+        if dir_path not in self._listed:
+            self._list_directory(dir_path)
+        stem = self._fit_stem(dir_path, stem, extension)
+        key = (dir_path, stem, extension)
+        counter = self._next.get(key, 0)
+        while True:
+            name = f"{stem}_{counter}{extension}" if counter else f"{stem}{extension}"
+            path = os.path.join(dir_path, name)
+            counter += 1
+            if self._is_free(path, source, link_type):
+                break
+        self._next[key] = counter
+        self._taken.add(path)
+        return path
+
 def compute_operations(data_list, new_path, renamed_files, processed_files, client):
-    """Compute the file operations based on generated metadata."""
+    """Compute the file operations based on generated metadata.
+
+    renamed_files is the DestinationNamer of the run (a set of already taken paths is
+    accepted as well); it is shared across calls so names stay unique.
+    """
+    namer = renamed_files if isinstance(renamed_files, DestinationNamer) else DestinationNamer(renamed_files)
     operations = []
     for data in data_list:
         file_path = data['file_path']
@@ -131,23 +174,17 @@ def compute_operations(data_list, new_path, renamed_files, processed_files, clie
         processed_files.add(file_path)
 
         # Prepare folder name and file name
-        folder_name = data['foldername']
-        new_file_name = data['filename'] + os.path.splitext(file_path)[1]
-
-        # Prepare new file path
+        # A shared cluster category, when assigned, replaces the per-file folder name
+        folder_name = data.get('category_cluster') or data['foldername']
+        extension = os.path.splitext(file_path)[1]
         dir_path = os.path.join(new_path, folder_name)
-        new_file_path = os.path.join(dir_path, new_file_name)
 
-        # Handle duplicates
-        counter = 1
-        original_new_file_name = new_file_name
-        while new_file_path in renamed_files:
-            new_file_name = f"{data['filename']}_{counter}" + os.path.splitext(file_path)[1]
-            new_file_path = os.path.join(dir_path, new_file_name)
-            counter += 1
+        # Cheapest valid way to materialize the file (hardlink, reflink, symlink or copy)
+        link_type = choose_link_type(file_path, new_path)
 
-        # Decide whether to use hardlink or symlink
-        link_type = 'hardlink'  # Assume hardlink for now
+        # Handle duplicates
+        new_file_path = namer.reserve(dir_path, data['filename'], extension, file_path, link_type)
+        new_file_name = os.path.basename(new_file_path)
 
         # Record the operation
         operation = {
@@ -158,7 +195,6 @@ def compute_operations(data_list, new_path, renamed_files, processed_files, clie
             'new_file_name': new_file_name
         }
         operations.append(operation)
-        renamed_files.add(new_file_path)
 
     # If you need to use the Azure OpenAI client for any additional processing,
     # you can use it here. For example:
@@ -172,44 +208,219 @@ def compute_operations(data_list, new_path, renamed_files, processed_files, clie
 
     return operations  # Return the list of operations for display or further processing
 
-def execute_operations(operations, dry_run=False, silent=False, log_file=None):
-    """Execute the file operations."""
+def is_existing_link(source, destination, link_type):
+    """Return True if destination already is the link or copy that the operation would create."""
+    try:
+        if link_type == 'symlink':
+            return os.path.islink(destination) and os.readlink(destination) == os.path.abspath(source)
+        source_stat = os.stat(source)
+        destination_stat = os.lstat(destination)
+        if (source_stat.st_dev, source_stat.st_ino) == (destination_stat.st_dev, destination_stat.st_ino):
+            return link_type == 'hardlink'
+        # Reflinks and copies (also the cross-filesystem fallback of hardlinks) keep the size and mtime of the source
+        return (source_stat.st_size == destination_stat.st_size
+                and int(source_stat.st_mtime) == int(destination_stat.st_mtime))
+    except OSError:
+        return False
+
+def clone_or_copy_file(source, destination, allow_copy=True):
+    """Copy a file, sharing its data blocks (reflink) when the filesystem supports it.
+
+    Tries the FICLONE ioctl first, then copy_file_range (which lets the kernel or a network
+    filesystem copy server side), then a plain copy. File metadata is copied as well.
+    Returns 'reflink' or 'copy'. With allow_copy=False a failed reflink is raised instead.
+    """
+    method = 'copy'
+    with open(source, 'rb') as src, open(destination, 'xb') as dst:
+        try:
+            import fcntl
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+            method = 'reflink'
+        except (ImportError, OSError):
+            if not allow_copy:
+                dst.close()
+                os.remove(destination)
+                raise
+            try:
+                remaining = os.fstat(src.fileno()).st_size
+                while remaining > 0:
+                    copied = os.copy_file_range(src.fileno(), dst.fileno(), remaining)
+                    if copied == 0:
+                        break
+                    remaining -= copied
+            except (AttributeError, OSError):
+                src.seek(0)
+                dst.seek(0)
+                dst.truncate()
+                shutil.copyfileobj(src, dst, 1 << 20)
+    shutil.copystat(source, destination)
+    return method
+
+def is_recorded_link(destination, dest_inode):
+    """Return True if destination is still the link the file index recorded.
+
+    Raises FileNotFoundError if destination is gone. Without a recorded inode (indexes
+    written by older versions) only absolute paths are trusted, since a relative one may
+    have been recorded from another working directory.
+    """
+    st = os.lstat(destination)
+    if dest_inode is None:
+        return os.path.isabs(destination)
+    return st.st_ino == dest_inode
+
+def execute_operation(operation, dry_run=False, make_dirs=True):
+    """Execute a single file operation.
+
+    Operations with link_type 'remove' delete a previously created link at 'destination',
+    provided it is still the file recorded in 'dest_inode'.
+    A hardlink across filesystems falls back to a reflink or copy, unless the link strategy
+    was forced. Pass make_dirs=False if the destination directory is known to exist.
+
+    Returns a (completed, message, transfer) tuple, where transfer is a (method, size) pair
+    for a newly created link or copy and None otherwise.
+    """
+    source = operation['source']
+    destination = operation['destination']
+    link_type = operation['link_type']
+    dir_path = os.path.dirname(destination)
+
+    if dry_run:
+        if link_type == 'remove':
+            return False, f"Dry run: would remove '{destination}'", None
+        return False, f"Dry run: would create {link_type} from '{source}' to '{destination}'", None
+
+    if link_type == 'remove':
+        try:
+            if not is_recorded_link(destination, operation.get('dest_inode')):
+                return True, f"Left '{destination}' in place: it is no longer the organized link", None
+            os.remove(destination)
+            return True, f"Removed '{destination}'", None
+        except FileNotFoundError:
+            return True, f"Already removed '{destination}'", None
+        except Exception as e:
+            return False, f"Error removing '{destination}': {e}", None
+
+    # Ensure the directory exists before performing the operation
+    if make_dirs:
+        os.makedirs(dir_path, exist_ok=True)
+
+    try:
+        if link_type == 'symlink':
+            os.symlink(os.path.abspath(source), destination)
+            method = 'symlink'
+        elif link_type in ('reflink', 'copy'):
+            method = clone_or_copy_file(source, destination, allow_copy=link_type == 'copy' or copy_fallback_allowed())
+        else:
+            try:
+                os.link(source, destination)
+                method = 'hardlink'
+            except OSError as e:
+                # Hardlinks cannot cross filesystems; a forced hardlink strategy never copies
+                if e.errno != errno.EXDEV or not copy_fallback_allowed():
+                    raise
+                method = clone_or_copy_file(source, destination)
+        size = os.stat(source).st_size
+        note = f" (instead of {link_type})" if method != link_type and link_type != 'copy' else ""
+        return True, f"Created {method} from '{source}' to '{destination}'{note}", (method, size)
+    except FileExistsError as e:
+        # A rerun or resumed run finds the links it already made; those are not errors
+        if is_existing_link(source, destination, link_type):
+            return True, f"Already linked '{source}' to '{destination}'", None
+        return False, f"Error creating {link_type} from '{source}' to '{destination}': {e}", None
+    except Exception as e:
+        return False, f"Error creating {link_type} from '{source}' to '{destination}': {e}", None
+
+def format_size(size):
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == 'B' else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TB"
+
+def summarize_transfers(transfers):
+    """Describe how much data was linked and how much was copied, from (method, size) pairs."""
+    linked = {}
+    linked_files = linked_bytes = copied_files = copied_bytes = 0
+    for method, size in transfers:
+        if method == 'copy':
+            copied_files += 1
+            copied_bytes += size
+        else:
+            linked[method] = linked.get(method, 0) + 1
+            linked_files += 1
+            linked_bytes += size
+    methods = ', '.join(f"{count} {method}" for method, count in sorted(linked.items()))
+    summary = f"Linked {linked_files} files ({format_size(linked_bytes)}"
+    summary += f": {methods})" if methods else ")"
+    return summary + f", copied {copied_files} files ({format_size(copied_bytes)})"
+
+def summarize_link_types(operations):
+    """Describe the planned link strategies, including how much data would be copied."""
+    counts = {}
+    copy_bytes = 0
+    for operation in operations:
+        link_type = operation['link_type']
+        if link_type == 'remove':
+            continue
+        counts[link_type] = counts.get(link_type, 0) + 1
+        if link_type == 'copy':
+            try:
+                copy_bytes += os.path.getsize(operation['source'])
+            except OSError:
+                pass
+    summary = "Link strategy: " + (', '.join(f"{count} {link_type}" for link_type, count in sorted(counts.items())) or 'nothing to link')
+    if copy_bytes:
+        summary += f" ({format_size(copy_bytes)} to copy)"
+    return summary
+
+def execute_operations(operations, dry_run=False, silent=False, log_file=None, journal=None, max_workers=LINK_WORKERS):
+    """Execute the file operations and return the ones that completed successfully.
+
+    Destination directories are created once up front, removals finish before any link is
+    created, and the operations are issued from a pool of max_workers threads. Each operation
+    is logged as a 'link' record, followed by a summary of the data linked and copied. If a
+    RunJournal is given, each completed operation is marked in it.
+    """
     total_operations = len(operations)
+    completed = []
+    transfers = []
 
     with Progress(
         TextColumn("[progress.description]{task.description}"),
         BarColumn(),
         TimeElapsedColumn(),
         transient=True
-    ) as progress:
+    ) as progress, ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
         task = progress.add_task("Organizing Files...", total=total_operations)
-        for operation in operations:
-            source = operation['source']
-            destination = operation['destination']
-            link_type = operation['link_type']
-            dir_path = os.path.dirname(destination)
-
-            if dry_run:
-                message = f"Dry run: would create {link_type} from '{source}' to '{destination}'"
-            else:
-                # Ensure the directory exists before performing the operation
+        if dry_run:
+            ordered = operations
+            results = (execute_operation(operation, dry_run=True) for operation in operations)
+        else:
+            for dir_path in sorted({os.path.dirname(op['destination']) for op in operations if op['link_type'] != 'remove'}):
                 os.makedirs(dir_path, exist_ok=True)
+            # A stale link has to be gone before a new link can take its path
+            removals = [op for op in operations if op['link_type'] == 'remove']
+            links = [op for op in operations if op['link_type'] != 'remove']
+            ordered = removals + links
+            results = (result for phase in (removals, links)
+                       for result in executor.map(lambda operation: execute_operation(operation, make_dirs=False), phase))
 
-                try:
-                    if link_type == 'hardlink':
-                        os.link(source, destination)
-                    else:
-                        os.symlink(source, destination)
-                    message = f"Created {link_type} from '{source}' to '{destination}'"
-                except Exception as e:
-                    message = f"Error creating {link_type} from '{source}' to '{destination}': {e}"
+        for operation, (success, message, transfer) in zip(ordered, results):
+            if success:
+                completed.append(operation)
+                if journal is not None:
+                    journal.mark_done(operation)
+                if transfer is not None:
+                    transfers.append(transfer)
 
             progress.advance(task)
 
-            # Silent mode handling
-            if silent:
-                if log_file:
-                    with open(log_file, 'a') as f:
-                        f.write(message + '\n')
-            else:
-                print(message)
\ No newline at end of file
+            log_message(message, silent, log_file, level='info' if success else 'error', path=operation['source'],
+                        stage='link', destination=operation['destination'], link_type=operation['link_type'],
+                        bytes=transfer[1] if transfer else None, error=None if success else message)
+        if transfers:
+            log_message(summarize_transfers(transfers), silent, log_file)
+
+    if journal is not None:
+        journal.flush()
+    return completed
@@ -0,0 +1,95 @@
+import os
+import hashlib
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from file_utils import compute_file_hash
+
+# What to do with files whose content is identical:
+#   link_all  - describe one copy and link every copy next to it (same folder and name stem)
+#   collapse  - link only one copy
+#   off       - process every file on its own
+DEDUP_POLICY = os.getenv("LFO_DEDUP", "link_all")
+DEDUP_POLICIES = ('link_all', 'collapse', 'off')
+# Bytes read from the start and the end of a file for the partial hash
+PARTIAL_HASH_BYTES = 64 * 1024
+HASH_WORKERS = 8
+
+def compute_partial_hash(file_path, chunk_size=PARTIAL_HASH_BYTES):
+    """Hash the first and last chunk_size bytes of a file."""
+    hasher = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        hasher.update(f.read(chunk_size))
+        f.seek(0, os.SEEK_END)
+        if f.tell() > chunk_size:
+            f.seek(max(chunk_size, f.tell() - chunk_size))
+            hasher.update(f.read(chunk_size))
+    return hasher.hexdigest()
+
+def _refine(groups, key_func, max_workers=HASH_WORKERS):
+    """Split each group of paths by key_func, keeping only the sub-groups with several paths."""
+    paths = [path for group in groups for path in group]
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        keys = list(executor.map(lambda path: _safe_key(key_func, path), paths))
+    refined = []
+    start = 0
+    for group in groups:
+        by_key = defaultdict(list)
+        for path, key in zip(group, keys[start:start + len(group)]):
+            if key is not None:
+                by_key[key].append(path)
+        start += len(group)
+        refined.extend(sub_group for sub_group in by_key.values() if len(sub_group) > 1)
+    return refined
+
+def _safe_key(key_func, path):
+    try:
+        return key_func(path)
+    except OSError:
+        return None
+
+def find_duplicate_groups(file_paths):
+    """Return groups (lists of two or more paths) of files with identical content.
+
+    Files are grouped by size first, so most files are never read. Files sharing a size are
+    compared by a partial hash of their first and last bytes, and only the remaining
+    candidates are hashed in full. Empty files are ignored.
+    """
+    by_size = defaultdict(list)
+    for file_path in file_paths:
+        try:
+            size = os.path.getsize(file_path)
+        except OSError:
+            continue
+        if size > 0:
+            by_size[size].append(file_path)
+    groups = [group for group in by_size.values() if len(group) > 1]
+    groups = _refine(groups, compute_partial_hash)
+    # Files no larger than the two partial chunks were hashed in full already
+    small = [group for group in groups if os.path.getsize(group[0]) <= 2 * PARTIAL_HASH_BYTES]
+    large = [group for group in groups if os.path.getsize(group[0]) > 2 * PARTIAL_HASH_BYTES]
+    return small + _refine(large, compute_file_hash)
+
+def deduplicate(file_paths):
+    """Split file_paths into one representative per distinct content and its duplicates.
+
+    Returns (unique_paths, duplicates): unique_paths keeps the input order, and duplicates
+    maps each representative (the first path of its group in sorted order) to the other
+    paths with the same content.
+    """
+    duplicates = {}
+    skipped = set()
+    for group in find_duplicate_groups(file_paths):
+        group = sorted(group)
+        duplicates[group[0]] = group[1:]
+        skipped.update(group[1:])
+    unique_paths = [file_path for file_path in file_paths if file_path not in skipped]
+    return unique_paths, duplicates
+
+def expand_duplicates(data_list, duplicates):
+    """Give every duplicate a copy of its representative's metadata, right after it."""
+    expanded = []
+    for data in data_list:
+        expanded.append(data)
+        for duplicate in duplicates.get(data['file_path'], []):
+            expanded.append({**data, 'file_path': duplicate})
+    return expanded
@@ -0,0 +1,205 @@
+import os
+import time
+import queue
+import threading
+import multiprocessing
+from multiprocessing.connection import wait
+from concurrent.futures import Future
+from run_log import log_message
+
+# Worker processes used to parse documents and decode images
+EXTRACT_WORKERS = int(os.getenv("LFO_EXTRACT_WORKERS", str(os.cpu_count() or 1)))
+# Seconds a single file may take to extract before its worker is killed
+EXTRACT_TIMEOUT = float(os.getenv("LFO_EXTRACT_TIMEOUT", "60"))
+
+_STOP = None
+
+def _worker_main(conn):
+    """Worker process loop: run (func, args) tasks and send back (ok, value) pairs."""
+    while True:
+        try:
+            task = conn.recv()
+        except EOFError:
+            return
+        if task is _STOP:
+            return
+        func, args = task
+        try:
+            conn.send((True, func(*args)))
+        except Exception as e:
+            conn.send((False, e))
+
+class ExtractionTimeout(TimeoutError):
+    pass
+
+class ExtractionPool:
+    """A process pool for CPU-bound extraction with a per-task timeout.
+
+    Unlike ProcessPoolExecutor, a task that runs longer than `timeout` seconds does not
+    hold on to its worker: the worker process is terminated and replaced, and the task's
+    future fails with ExtractionTimeout. This keeps one pathological file from stalling
+    a run. submit() is thread-safe and returns a concurrent.futures.Future; tasks must
+    be picklable module-level functions that return only the data the parent needs.
+    """
+
+    def __init__(self, max_workers=EXTRACT_WORKERS, timeout=EXTRACT_TIMEOUT):
+        self.max_workers = max(1, max_workers)
+        self.timeout = timeout
+        # spawn, because forking from a process that runs threads (progress display, stages) is unsafe
+        self._context = multiprocessing.get_context('spawn')
+        self._tasks = queue.Queue()
+        self._lock = threading.Lock()
+        self._error = None  # Set if the dispatcher thread died; later tasks fail with it
+        self._dispatcher = threading.Thread(target=self._run, daemon=True)
+        self._dispatcher.start()
+
+    def submit(self, func, *args):
+        future = Future()
+        with self._lock:
+            if self._error is None:
+                self._tasks.put((future, func, args))
+                return future
+        future.set_exception(self._error)
+        return future
+
+    def map(self, func, items):
+        """Run func over items and return the results in order; failed items give None."""
+        futures = [self.submit(func, item) for item in items]
+        results = []
+        for item, future in zip(items, futures):
+            try:
+                results.append(future.result())
+            except ExtractionTimeout:
+                log_message(f"Timed out extracting {item} after {self.timeout:.0f} seconds", level='error',
+                            path=item, stage='extract', error='timeout')
+                results.append(None)
+            except Exception as e:
+                log_message(f"Error extracting {item}: {e}", level='error', path=item, stage='extract', error=str(e))
+                results.append(None)
+        return results
+
+    def _spawn(self):
+        parent_conn, child_conn = self._context.Pipe()
+        try:
+            process = self._context.Process(target=_worker_main, args=(child_conn,), daemon=True)
+            process.start()
+        except BaseException:
+            parent_conn.close()
+            raise
+        finally:
+            child_conn.close()
+        return process, parent_conn
+
+    def _run(self):
+        busy = {}  # conn -> (process, future, deadline)
+        try:
+            self._dispatch(busy)
+        except BaseException as e:
+            # Without the dispatcher nothing would ever complete: fail every pending future
+            error = RuntimeError(f"Extraction pool stopped: {e}")
+            with self._lock:
+                self._error = error
+            for process, future, _ in busy.values():
+                process.terminate()
+                if not future.done():
+                    future.set_exception(error)
+            while True:
+                try:
+                    task = self._tasks.get_nowait()
+                except queue.Empty:
+                    break
+                if task is not _STOP and task[0].set_running_or_notify_cancel():
+                    task[0].set_exception(error)
+            raise
+
+    def _dispatch(self, busy):
+        idle = []
+        workers = 0
+        stopping = False
+        while True:
+            # Hand out tasks to idle (or new) workers; block only when nothing is running
+            while not stopping and (idle or workers < self.max_workers):
+                try:
+                    task = self._tasks.get(block=not busy)
+                except queue.Empty:
+                    break
+                if task is _STOP:
+                    stopping = True
+                    break
+                future, func, args = task
+                if not future.set_running_or_notify_cancel():
+                    continue
+                if idle:
+                    process, conn = idle.pop()
+                else:
+                    try:
+                        process, conn = self._spawn()
+                    except Exception as e:  # e.g. EAGAIN or EMFILE when starting the process
+                        future.set_exception(e)
+                        continue
+                    workers += 1
+                try:
+                    conn.send((func, args))
+                except Exception as e:  # e.g. arguments that cannot be pickled
+                    future.set_exception(e)
+                    idle.append((process, conn))
+                    continue
+                deadline = time.monotonic() + self.timeout if self.timeout else None
+                busy[conn] = (process, future, deadline)
+
+            if not busy:
+                if stopping:
+                    break
+                continue
+
+            deadlines = [deadline for _, _, deadline in busy.values() if deadline is not None]
+            # Wake up periodically to pick up tasks for workers that are still free
+            wait_time = 0.05 if (idle or workers < self.max_workers) and not stopping else None
+            if deadlines:
+                until_deadline = max(0, min(deadlines) - time.monotonic())
+                wait_time = until_deadline if wait_time is None else min(wait_time, until_deadline)
+            for conn in wait(list(busy), timeout=wait_time):
+                process, future, _ = busy.pop(conn)
+                try:
+                    ok, value = conn.recv()
+                except (EOFError, OSError):
+                    process.join(timeout=1)
+                    future.set_exception(RuntimeError(f"Extraction worker exited with code {process.exitcode}"))
+                    conn.close()
+                    workers -= 1
+                    continue
+                if ok:
+                    future.set_result(value)
+                else:
+                    future.set_exception(value)
+                idle.append((process, conn))
+
+            now = time.monotonic()
+            for conn, (process, future, deadline) in list(busy.items()):
+                if deadline is not None and now >= deadline:
+                    del busy[conn]
+                    process.terminate()
+                    conn.close()
+                    workers -= 1
+                    future.set_exception(ExtractionTimeout(f"extraction exceeded {self.timeout:.0f} seconds"))
+
+        for process, conn in idle:
+            try:
+                conn.send(_STOP)
+            except OSError:
+                pass
+            conn.close()
+            process.join(timeout=1)
+            if process.is_alive():
+                process.terminate()
+
+    def shutdown(self):
+        """Finish the submitted tasks and stop the worker processes."""
+        self._tasks.put(_STOP)
+        self._dispatcher.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
@@ -0,0 +1,140 @@
+import os
+import sqlite3
+from file_utils import compute_file_hash
+
+INDEX_FILE_NAME = '.file_index.sqlite'
+
+class FileIndex:
+    """Persistent record of the files organized into an output directory.
+
+    Each source file is stored with its inode, size, mtime and (optionally) content hash
+    together with the destination it was last linked to and that destination's inode, per
+    organization mode. This lets a run plan operations only for new or changed files and
+    remove links of deleted ones. Paths are expected to be absolute.
+    """
+
+    def __init__(self, output_path, mode, hash_contents=None):
+        self.db_path = os.path.join(output_path, INDEX_FILE_NAME)
+        self.mode = mode
+        # Hashing lets content mode ignore touched-but-unchanged files; date mode depends on mtime anyway
+        self.hash_contents = (mode == 'content') if hash_contents is None else hash_contents
+        self._conn = None
+        if os.path.exists(self.db_path):
+            self._connect()
+
+    def _connect(self):
+        os.makedirs(os.path.dirname(self.db_path) or '.', exist_ok=True)
+        self._conn = sqlite3.connect(self.db_path)
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS files (
+                mode TEXT NOT NULL,
+                path TEXT NOT NULL,
+                inode INTEGER,
+                size INTEGER,
+                mtime_ns INTEGER,
+                content_hash TEXT,
+                destination TEXT,
+                dest_inode INTEGER,
+                PRIMARY KEY (mode, path)
+            )"""
+        )
+        columns = {row[1] for row in self._conn.execute('PRAGMA table_info(files)')}
+        if 'dest_inode' not in columns:
+            # Indexes written before destination inodes were recorded
+            self._conn.execute('ALTER TABLE files ADD COLUMN dest_inode INTEGER')
+        self._conn.commit()
+
+    def _entries(self):
+        if self._conn is None:
+            return {}
+        rows = self._conn.execute(
+            'SELECT path, inode, size, mtime_ns, content_hash, destination, dest_inode FROM files WHERE mode = ?',
+            (self.mode,)
+        )
+        return {row[0]: row[1:] for row in rows}
+
+    def diff(self, file_paths, filtered=False):
+        """Compare file_paths against the index.
+
+        Returns (changed_paths, removal_operations): the new or modified files that need to
+        be planned, and 'remove' operations for links of modified or deleted files. If
+        file_paths was filtered (include/exclude patterns, a depth limit), indexed files
+        missing from it are only unlinked once they no longer exist.
+        """
+        entries = self._entries()
+        changed_paths = []
+        removal_operations = []
+        touched = []
+        for file_path in file_paths:
+            entry = entries.pop(file_path, None)
+            if entry is None:
+                changed_paths.append(file_path)
+                continue
+            inode, size, mtime_ns, content_hash, destination, dest_inode = entry
+            try:
+                st = os.stat(file_path)
+            except OSError:
+                continue
+            if not os.path.lexists(destination):
+                changed_paths.append(file_path)
+                continue
+            if (st.st_ino, st.st_size, st.st_mtime_ns) == (inode, size, mtime_ns):
+                continue
+            if self.hash_contents and content_hash and st.st_size == size \
+                    and compute_file_hash(file_path) == content_hash:
+                touched.append((st.st_ino, st.st_mtime_ns, file_path))
+                continue
+            changed_paths.append(file_path)
+            removal_operations.append({'source': file_path, 'destination': destination, 'link_type': 'remove',
+                                       'dest_inode': dest_inode})
+
+        # Whatever is left in the index no longer exists in the input
+        for file_path, entry in entries.items():
+            if filtered and os.path.lexists(file_path):
+                continue
+            removal_operations.append({'source': file_path, 'destination': entry[4], 'link_type': 'remove',
+                                       'dest_inode': entry[5]})
+
+        if touched:
+            self._conn.executemany(
+                'UPDATE files SET inode = ?, mtime_ns = ? WHERE mode = ? AND path = ?',
+                [(inode, mtime_ns, self.mode, path) for inode, mtime_ns, path in touched]
+            )
+            self._conn.commit()
+        return changed_paths, removal_operations
+
+    def destinations(self):
+        """Return the set of destinations currently recorded in the index."""
+        return {entry[4] for entry in self._entries().values()}
+
+    def record(self, operations):
+        """Record successfully executed operations."""
+        if self._conn is None:
+            self._connect()
+        rows = []
+        removed = []
+        for operation in operations:
+            source = operation['source']
+            if operation['link_type'] == 'remove':
+                if not os.path.lexists(source):
+                    removed.append((self.mode, source))
+                continue
+            try:
+                st = os.stat(source)
+                dest_inode = os.lstat(operation['destination']).st_ino
+                content_hash = compute_file_hash(source) if self.hash_contents else None
+            except OSError:
+                continue
+            rows.append((self.mode, source, st.st_ino, st.st_size, st.st_mtime_ns,
+                         content_hash, operation['destination'], dest_inode))
+        self._conn.executemany('DELETE FROM files WHERE mode = ? AND path = ?', removed)
+        self._conn.executemany(
+            'INSERT OR REPLACE INTO files (mode, path, inode, size, mtime_ns, content_hash, destination, dest_inode) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?)', rows
+        )
+        self._conn.commit()
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
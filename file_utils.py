@@ -1,151 +1,299 @@
 import os
 import re
 import shutil
-from PIL import Image
-import pytesseract
-import fitz  # PyMuPDF
-import docx
-import pandas as pd  # Import pandas to read Excel and CSV files
-from pptx import Presentation  # Import Presentation for PPT files
-from openai import AzureOpenAI
-
-def read_text_file(file_path):
+import queue
+import fnmatch
+import hashlib
+import threading
+from extraction_pool import ExtractionPool, EXTRACT_WORKERS, EXTRACT_TIMEOUT
+from run_log import log_message
+
+# Document libraries are imported inside the readers that need them, so that
+# date and type modes (and unused formats) do not pay for importing them.
+
+# Characters of content extracted from each document (roughly 4 characters per token).
+# Readers stop as soon as the budget is filled instead of extracting the whole document.
+EXTRACT_CHAR_BUDGET = int(os.getenv("LFO_EXTRACT_CHARS", "2000"))
+# Upper bounds for documents whose text is sparse (e.g. mostly images or empty cells)
+PDF_MAX_PAGES = int(os.getenv("LFO_PDF_MAX_PAGES", "20"))
+SPREADSHEET_MAX_ROWS = int(os.getenv("LFO_SPREADSHEET_MAX_ROWS", "100"))
+
+def _join_until(parts, max_chars, separator='\n'):
+    """Join text parts from an iterable, stopping once max_chars characters are collected."""
+    collected = []
+    total = 0
+    for part in parts:
+        if not part:
+            continue
+        collected.append(part)
+        total += len(part) + len(separator)
+        if total >= max_chars:
+            break
+    return separator.join(collected)[:max_chars]
+
+def read_text_file(file_path, max_chars=EXTRACT_CHAR_BUDGET):
     """Read text content from a text file."""
-    max_chars = 3000  # Limit processing time
     try:
         with open(file_path, 'r', encoding='utf-8', errors='ignore') as file:
             text = file.read(max_chars)
         return text
     except Exception as e:
-        print(f"Error reading text file {file_path}: {e}")
+        log_message(f"Error reading text file {file_path}: {e}", level='error', path=file_path, stage='extract', error=str(e))
         return None
 
-def read_docx_file(file_path):
+def read_docx_file(file_path, max_chars=EXTRACT_CHAR_BUDGET):
     """Read text content from a .docx or .doc file."""
     try:
+        import docx
+        from docx.oxml.ns import qn
+        from docx.text.paragraph import Paragraph
         doc = docx.Document(file_path)
-        full_text = [para.text for para in doc.paragraphs]
-        return '\n'.join(full_text)
+        # Walk the body paragraphs one at a time rather than building doc.paragraphs for the whole document
+        paragraphs = (Paragraph(element, doc).text for element in doc.element.body.iterchildren(qn('w:p')))
+        return _join_until(paragraphs, max_chars)
     except Exception as e:
-        print(f"Error reading DOCX file {file_path}: {e}")
+        log_message(f"Error reading DOCX file {file_path}: {e}", level='error', path=file_path, stage='extract', error=str(e))
         return None
 
-def read_pdf_file(file_path):
-    """Read text content from a PDF file."""
+def read_pdf_file(file_path, max_chars=EXTRACT_CHAR_BUDGET, max_pages=PDF_MAX_PAGES):
+    """Read text content from a PDF file, page by page until max_chars are collected.
+
+    Pages without a text layer (scans) are rasterized and OCR'd when OCR is available.
+    """
     try:
-        doc = fitz.open(file_path)
-        # Read only the first few pages to speed up processing
-        num_pages_to_read = 3  # Adjust as needed
-        full_text = []
-        for page_num in range(min(num_pages_to_read, len(doc))):
-            page = doc.load_page(page_num)
-            full_text.append(page.get_text())
-        pdf_content = '\n'.join(full_text)
-        return pdf_content
+        import fitz  # PyMuPDF
+        import ocr
+        content_hash = []
+
+        def page_text(page):
+            text = page.get_text()
+            if len(text.strip()) >= ocr.OCR_MIN_PAGE_CHARS or not ocr.OCR_ENABLED or not ocr.ocr_available():
+                return text
+            if not content_hash:
+                content_hash.append(compute_file_hash(file_path))
+            return ocr.cached_ocr(content_hash[0], page.number, ocr.OCR_DPI, lambda: ocr.ocr_pdf_page(page))
+
+        with fitz.open(file_path) as doc:
+            pages = (page_text(doc.load_page(page_num)) for page_num in range(min(max_pages, len(doc))))
+            return _join_until(pages, max_chars)
     except Exception as e:
-        print(f"Error reading PDF file {file_path}: {e}")
+        log_message(f"Error reading PDF file {file_path}: {e}", level='error', path=file_path, stage='extract', error=str(e))
         return None
 
-def read_spreadsheet_file(file_path):
-    """Read text content from an Excel or CSV file."""
+def read_spreadsheet_file(file_path, max_chars=EXTRACT_CHAR_BUDGET, max_rows=SPREADSHEET_MAX_ROWS):
+    """Read text content from the first rows of an Excel or CSV file."""
     try:
+        import pandas as pd  # Import pandas to read Excel and CSV files
         if file_path.lower().endswith('.csv'):
-            df = pd.read_csv(file_path)
+            df = pd.read_csv(file_path, nrows=max_rows)
         else:
-            df = pd.read_excel(file_path)
-        text = df.to_string()
-        return text
+            df = pd.read_excel(file_path, nrows=max_rows)
+        text = df.to_string(max_colwidth=50)
+        return text[:max_chars]
     except Exception as e:
-        print(f"Error reading spreadsheet file {file_path}: {e}")
+        log_message(f"Error reading spreadsheet file {file_path}: {e}", level='error', path=file_path, stage='extract', error=str(e))
         return None
 
-def read_ppt_file(file_path):
-    """Read text content from a PowerPoint file."""
+def read_ppt_file(file_path, max_chars=EXTRACT_CHAR_BUDGET):
+    """Read text content from a PowerPoint file, slide by slide until max_chars are collected."""
     try:
+        from pptx import Presentation  # Import Presentation for PPT files
         prs = Presentation(file_path)
-        full_text = []
-        for slide in prs.slides:
-            for shape in slide.shapes:
-                if hasattr(shape, "text"):
-                    full_text.append(shape.text)
-        return '\n'.join(full_text)
+        texts = (shape.text for slide in prs.slides for shape in slide.shapes if hasattr(shape, "text"))
+        return _join_until(texts, max_chars)
     except Exception as e:
-        print(f"Error reading PowerPoint file {file_path}: {e}")
+        log_message(f"Error reading PowerPoint file {file_path}: {e}", level='error', path=file_path, stage='extract', error=str(e))
         return None
 
-def read_file_data(file_path, llm_chat_completion):
-    """Read content from a file based on its extension and summarize using the selected LLM."""
+def read_file_data(file_path, llm_chat_completion=None, max_chars=EXTRACT_CHAR_BUDGET):
+    """Read content from a file based on its extension.
+
+    If llm_chat_completion is given the content is summarized with the selected LLM;
+    otherwise the first max_chars characters of raw content are returned, so the metadata
+    step works from the document itself rather than from a summary of it.
+    """
     ext = os.path.splitext(file_path.lower())[1]
     content = None
     if ext in ['.txt', '.md']:
-        content = read_text_file(file_path)
+        content = read_text_file(file_path, max_chars)
     elif ext in ['.docx', '.doc']:
-        content = read_docx_file(file_path)
+        content = read_docx_file(file_path, max_chars)
     elif ext == '.pdf':
-        content = read_pdf_file(file_path)
+        content = read_pdf_file(file_path, max_chars)
     elif ext in ['.xls', '.xlsx', '.csv']:
-        content = read_spreadsheet_file(file_path)
+        content = read_spreadsheet_file(file_path, max_chars)
     elif ext in ['.ppt', '.pptx']:
-        content = read_ppt_file(file_path)
+        content = read_ppt_file(file_path, max_chars)
     elif ext in ['.py', '.js', '.cpp', '.c', '.java', '.html', '.css', '.php', '.rb', '.go', '.rs', '.ts']:
-        content = read_code_file(file_path)
+        content = read_code_file(file_path, max_chars)
     
-    if content:
+    if content and llm_chat_completion is None:
+        return content[:max_chars]
+    elif content:
         # Use the selected LLM to summarize or process the content
-        summary_prompt = f"Summarize the following content in 100 words or less. If it's code, describe its purpose and main components:\n\n{content[:2000]}"
+        summary_prompt = f"Summarize the following content in 100 words or less. If it's code, describe its purpose and main components:\n\n{content[:max_chars]}"
         return llm_chat_completion(summary_prompt)
     else:
         return None  # Unsupported file type
 
-def read_code_file(file_path):
+def extract_files_data(file_paths, max_workers=EXTRACT_WORKERS, timeout=EXTRACT_TIMEOUT):
+    """Read the raw content of several files in worker processes, returning the results in input order.
+
+    A file that cannot be read, or takes longer than `timeout` seconds, gives None.
+    """
+    if not file_paths:
+        return []
+    with ExtractionPool(max_workers=min(max_workers, len(file_paths)), timeout=timeout) as pool:
+        return pool.map(read_file_data, file_paths)
+
+def read_code_file(file_path, max_chars=EXTRACT_CHAR_BUDGET):
     """Read content from a code file."""
-    max_chars = 3000  # Limit processing time
     try:
         with open(file_path, 'r', encoding='utf-8', errors='ignore') as file:
             text = file.read(max_chars)
         return text
     except Exception as e:
-        print(f"Error reading code file {file_path}: {e}")
+        log_message(f"Error reading code file {file_path}: {e}", level='error', path=file_path, stage='extract', error=str(e))
         return None
 
 def display_directory_tree(path):
     """Display the directory tree in a format similar to the 'tree' command, including the full path."""
     def tree(dir_path, prefix=''):
-        contents = sorted([c for c in os.listdir(dir_path) if not c.startswith('.')])
+        with os.scandir(dir_path) as it:
+            contents = sorted((e for e in it if not e.name.startswith('.')), key=lambda e: e.name)
         pointers = ['├── '] * (len(contents) - 1) + ['└── '] if contents else []
-        for pointer, name in zip(pointers, contents):
-            full_path = os.path.join(dir_path, name)
-            print(prefix + pointer + name)
-            if os.path.isdir(full_path):
+        for pointer, entry in zip(pointers, contents):
+            print(prefix + pointer + entry.name)
+            if entry.is_dir():
                 extension = '│   ' if pointer == '├── ' else '    '
-                tree(full_path, prefix + extension)
+                tree(entry.path, prefix + extension)
     if os.path.isdir(path):
         print(os.path.abspath(path))
         tree(path)
     else:
         print(os.path.abspath(path))
 
-def collect_file_paths(base_path):
+def _matches_any(entry, rel_path, patterns):
+    return any(fnmatch.fnmatch(entry.name, p) or fnmatch.fnmatch(rel_path, p) for p in patterns)
+
+def walk_files(base_path, include=None, exclude=None, max_depth=None, max_workers=8, queue_size=1000):
+    """Yield an os.DirEntry for every non-hidden file under base_path.
+
+    Directories are scanned with os.scandir by a pool of threads and entries are yielded
+    as soon as they are found, so callers can start working before the walk finishes.
+    Yield order is therefore not deterministic.
+
+    include/exclude are glob patterns matched against the entry name or its path relative
+    to base_path; excluded directories are not descended into. max_depth limits how many
+    directory levels below base_path are visited (0 = base_path only).
+    """
+    include = list(include or [])
+    exclude = list(exclude or [])
+    directories = queue.Queue()
+    results = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+    lock = threading.Lock()
+    pending = [1]  # Directories queued or being scanned
+    done = object()
+
+    def put_result(item):
+        while not stop.is_set():
+            try:
+                results.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def scan(dir_path, depth):
+        files = []
+        try:
+            with os.scandir(dir_path) as it:
+                for entry in it:
+                    if stop.is_set():
+                        return
+                    try:
+                        is_dir = entry.is_dir(follow_symlinks=False)
+                        is_file = not is_dir and entry.is_file()
+                    except OSError:
+                        continue
+                    rel_path = os.path.relpath(entry.path, base_path) if include or exclude else entry.name
+                    if exclude and _matches_any(entry, rel_path, exclude):
+                        continue
+                    if is_dir:
+                        if max_depth is None or depth < max_depth:
+                            with lock:
+                                pending[0] += 1
+                            directories.put((entry.path, depth + 1))
+                    elif is_file and not entry.name.startswith('.'):  # Exclude hidden files
+                        if not include or _matches_any(entry, rel_path, include):
+                            files.append(entry)
+        except OSError:
+            pass
+        if files:
+            # One queue item per directory keeps the hand-off cost off the per-file path
+            put_result(files)
+
+    def worker():
+        while True:
+            item = directories.get()
+            if item is None:
+                return
+            scan(*item)
+            with lock:
+                pending[0] -= 1
+                finished = pending[0] == 0
+            if finished:
+                put_result(done)
+
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(max_workers)]
+    for thread in threads:
+        thread.start()
+    directories.put((base_path, 0))
+    try:
+        while True:
+            item = results.get()
+            if item is done:
+                break
+            yield from item
+    finally:
+        stop.set()
+        for _ in threads:
+            directories.put(None)
+        for thread in threads:
+            thread.join()
+
+def iter_file_paths(base_path, include=None, exclude=None, max_depth=None):
+    """Yield file paths from the base directory or single file as they are found, in no particular order."""
+    if os.path.isfile(base_path):
+        yield base_path
+    else:
+        for entry in walk_files(base_path, include, exclude, max_depth):
+            yield entry.path
+
+def collect_file_paths(base_path, include=None, exclude=None, max_depth=None):
     """Collect all file paths from the base directory or single file, excluding hidden files."""
     if os.path.isfile(base_path):
         return [base_path]
     else:
-        file_paths = []
-        for root, _, files in os.walk(base_path):
-            for file in files:
-                if not file.startswith('.'):  # Exclude hidden files
-                    file_paths.append(os.path.join(root, file))
-        return file_paths
+        return sorted(entry.path for entry in walk_files(base_path, include, exclude, max_depth))
+
+def compute_file_hash(file_path, chunk_size=1 << 20):
+    """Compute the SHA-256 hash of a file's content."""
+    hasher = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.bmp', '.tiff')
+TEXT_EXTENSIONS = ('.txt', '.docx', '.doc', '.pdf', '.md', '.xls', '.xlsx', '.ppt', '.pptx', '.csv')
+CODE_EXTENSIONS = ('.py', '.js', '.cpp', '.c', '.java', '.html', '.css', '.php', '.rb', '.go', '.rs', '.ts')
 
 def separate_files_by_type(file_paths):
     """Separate files into images, text files, and code files based on their extensions."""
-    image_extensions = ('.png', '.jpg', '.jpeg', '.gif', '.bmp', '.tiff')
-    text_extensions = ('.txt', '.docx', '.doc', '.pdf', '.md', '.xls', '.xlsx', '.ppt', '.pptx', '.csv')
-    code_extensions = ('.py', '.js', '.cpp', '.c', '.java', '.html', '.css', '.php', '.rb', '.go', '.rs', '.ts')
-    
-    image_files = [fp for fp in file_paths if os.path.splitext(fp.lower())[1] in image_extensions]
-    text_files = [fp for fp in file_paths if os.path.splitext(fp.lower())[1] in text_extensions]
-    code_files = [fp for fp in file_paths if os.path.splitext(fp.lower())[1] in code_extensions]
+    image_files = [fp for fp in file_paths if os.path.splitext(fp.lower())[1] in IMAGE_EXTENSIONS]
+    text_files = [fp for fp in file_paths if os.path.splitext(fp.lower())[1] in TEXT_EXTENSIONS]
+    code_files = [fp for fp in file_paths if os.path.splitext(fp.lower())[1] in CODE_EXTENSIONS]
 
     # Combine text and code files for processing
     all_text_files = text_files + code_files
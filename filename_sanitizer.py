@@ -0,0 +1,105 @@
+import os
+import re
+import functools
+
+# Words removed from generated names: file type words, filler words and prompt echoes
+DEFAULT_STOPWORDS = (
+    'jpg', 'jpeg', 'png', 'gif', 'bmp', 'txt', 'md', 'pdf', 'docx', 'xls', 'xlsx', 'csv', 'ppt', 'pptx',
+    'image', 'picture', 'photo', 'this', 'that', 'these', 'those', 'here', 'there',
+    'please', 'note', 'additional', 'notes', 'folder', 'name', 'sure', 'heres', 'a', 'an', 'the', 'and', 'of', 'in',
+    'to', 'for', 'on', 'with', 'your', 'answer', 'should', 'be', 'only', 'summary', 'summarize', 'text', 'category',
+)
+# Additional comma-separated stopwords, e.g. "scan,copy,final"
+EXTRA_STOPWORDS = tuple(word.strip() for word in os.getenv("LFO_EXTRA_STOPWORDS", "").split(',') if word.strip())
+# Longest name, in UTF-8 bytes, that most filesystems accept (ext4, XFS, btrfs, APFS)
+MAX_NAME_BYTES = int(os.getenv("LFO_MAX_NAME_BYTES", "255"))
+# Bytes kept free for the extension and a collision suffix such as "_123"
+NAME_BYTES_RESERVE = 32
+
+_NON_WORD = re.compile(r'[^\w\s]')
+_SEPARATORS = re.compile(r'[\s_]+')
+
+def name_byte_limit(path):
+    """Return the longest filename, in UTF-8 bytes, accepted in directory path (or where it will be created)."""
+    path = os.path.abspath(path)
+    while not os.path.exists(path) and os.path.dirname(path) != path:
+        path = os.path.dirname(path)
+    try:
+        limit = os.pathconf(path, 'PC_NAME_MAX')
+    except (AttributeError, ValueError, OSError):
+        limit = MAX_NAME_BYTES
+    return min(limit, MAX_NAME_BYTES) if limit > 0 else MAX_NAME_BYTES
+
+def truncate_utf8(name, max_bytes):
+    """Cut name to at most max_bytes bytes of UTF-8 without splitting a character."""
+    encoded = name.encode('utf-8')
+    if len(encoded) <= max_bytes:
+        return name
+    return encoded[:max_bytes].decode('utf-8', 'ignore')
+
+class FilenameSanitizer:
+    """Turns LLM output into short, filesystem-safe names.
+
+    The stopword pattern is compiled once per sanitizer instead of on every call. Most of
+    the saving comes from sanitize_filename's cache, though: the LLM keeps returning the
+    same folder and file names, and a cache hit skips the regular expressions entirely.
+    """
+
+    def __init__(self, stopwords=DEFAULT_STOPWORDS + EXTRA_STOPWORDS, max_bytes=MAX_NAME_BYTES - NAME_BYTES_RESERVE):
+        self.stopwords = frozenset(word.lower() for word in stopwords)
+        self.max_bytes = max_bytes
+        alternation = '|'.join(sorted((re.escape(word) for word in self.stopwords), key=len, reverse=True))
+        self._stopword_pattern = re.compile(r'\b(' + alternation + r')\b', re.IGNORECASE) if alternation else None
+
+    def sanitize(self, name, max_length=50, max_words=5):
+        """Sanitize a single name."""
+        # Remove file extension, unwanted words and non-word characters except underscores
+        name = os.path.splitext(name)[0]
+        if self._stopword_pattern is not None:
+            name = self._stopword_pattern.sub('', name)
+        sanitized = _NON_WORD.sub('', name).strip()
+        # Replace multiple underscores or spaces with a single underscore
+        sanitized = _SEPARATORS.sub('_', sanitized).lower().strip('_')
+        # Split into words and limit the number of words
+        limited_name = '_'.join([word for word in sanitized.split('_') if word][:max_words])
+        # Limit length, in characters and in UTF-8 bytes
+        return truncate_utf8(limited_name[:max_length], self.max_bytes) if limited_name else 'untitled'
+
+_default_sanitizer = FilenameSanitizer()
+
+@functools.lru_cache(maxsize=65536)
+def sanitize_filename(name, max_length=50, max_words=5):
+    """Sanitize a name with the default sanitizer; hot names (e.g. 'invoice') are served from a cache."""
+    return _default_sanitizer.sanitize(name, max_length, max_words)
+
+if __name__ == '__main__':
+    # Micro-benchmark: python filename_sanitizer.py [number_of_names]
+    import sys
+    import random
+    import timeit
+
+    def legacy_sanitize(name, max_length=50, max_words=5):
+        # The previous implementation, which compiled its patterns on every call
+        name = os.path.splitext(name)[0]
+        name = re.sub(r'\b(' + '|'.join(DEFAULT_STOPWORDS) + r')\b', '', name, flags=re.IGNORECASE)
+        sanitized = re.sub(r'[^\w\s]', '', name).strip()
+        sanitized = re.sub(r'[\s_]+', '_', sanitized).lower().strip('_')
+        limited_name = '_'.join([word for word in sanitized.split('_') if word][:max_words])
+        return limited_name[:max_length] if limited_name else 'untitled'
+
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    rng = random.Random(0)
+    vocabulary = ['invoice', 'Screenshot', 'the', 'quarterly', 'report', 'photo', 'of', 'a', 'cat', 'Résumé',
+                  '2024', 'project-plan', 'meeting_notes', 'Here is', 'PDF', 'budget!', 'Straße', '東京']
+    names = [' '.join(rng.choices(vocabulary, k=rng.randint(1, 6))) for _ in range(count)]
+    sanitizer = FilenameSanitizer(DEFAULT_STOPWORDS)
+    assert [legacy_sanitize(name) for name in names[:2000]] == [sanitizer.sanitize(name) for name in names[:2000]]
+
+    runs = {
+        'legacy (per call compile)': lambda: [legacy_sanitize(name) for name in names],
+        'precompiled, per name': lambda: [sanitizer.sanitize(name) for name in names],
+        'cached sanitize_filename': lambda: [sanitize_filename(name) for name in names],
+    }
+    for label, run in runs.items():
+        seconds = min(timeit.repeat(run, number=1, repeat=3))
+        print(f"{label:28s} {seconds * 1e6 / count:7.2f} us/name")
@@ -1,52 +1,144 @@
 import re
 import os
 import time
+import io
 import base64
-from PIL import Image
+import mimetypes
+from collections import deque
 from rich.progress import Progress, TextColumn, BarColumn, TimeElapsedColumn
 from data_processing_common import sanitize_filename
-from llm_utils import get_vision_llm
-import groq
+from llm_utils import get_llm_response, get_vision_llm, get_fallback_text_llm, parse_json_response
+from extraction_pool import ExtractionPool
+from ocr import OCR_IMAGES, extract_document_image_text
+from text_data_processing import process_single_text_file
+from run_log import log_message, file_size
+
+# Bump whenever the metadata prompts change so cached results are regenerated
+IMAGE_PROMPT_VERSION = '2'
+
+# Images are downscaled and re-encoded before upload to cut payload size
+IMAGE_MAX_EDGE = int(os.getenv("LFO_IMAGE_MAX_EDGE", "1024"))
+IMAGE_FORMAT = os.getenv("LFO_IMAGE_FORMAT", "JPEG").upper()  # JPEG or WEBP
+IMAGE_QUALITY = int(os.getenv("LFO_IMAGE_QUALITY", "85"))
+IMAGE_WORKERS = int(os.getenv("LFO_IMAGE_WORKERS", str(os.cpu_count() or 1)))
+
+IMAGE_MIME_TYPES = {'JPEG': 'image/jpeg', 'WEBP': 'image/webp'}
 
 def is_animated_gif(image_path):
+    from PIL import Image
     try:
         with Image.open(image_path) as img:
             return getattr(img, "is_animated", False)
     except:
         return False
 
-def encode_image(image_path):
-    with open(image_path, "rb") as image_file:
-        return base64.b64encode(image_file.read()).decode('utf-8')
+def encode_image(image_path, max_edge=IMAGE_MAX_EDGE, image_format=IMAGE_FORMAT, quality=IMAGE_QUALITY):
+    """Downscale and re-encode an image for upload.
+
+    The image is rotated according to its EXIF orientation, resized so its longest edge is
+    at most `max_edge` pixels and re-encoded as JPEG or WebP. Returns a (base64_data,
+    mime_type) tuple. Files PIL cannot decode are sent as-is with their guessed MIME type.
+    """
+    from PIL import Image, ImageOps
+    try:
+        with Image.open(image_path) as original:
+            source_format = original.format
+            img = ImageOps.exif_transpose(original)
+            unchanged = original.getexif().get(0x0112, 1) == 1  # EXIF orientation is already upright
+            img.thumbnail((max_edge, max_edge))
+            unchanged = unchanged and img.size == original.size
+            if image_format == 'JPEG' and img.mode != 'RGB':
+                img = img.convert('RGB')
+            elif image_format == 'WEBP' and img.mode not in ('RGB', 'RGBA'):
+                img = img.convert('RGBA' if 'A' in img.getbands() else 'RGB')
+            buffer = io.BytesIO()
+            img.save(buffer, format=image_format, quality=quality)
+        encoded = buffer.getvalue()
+        # Re-encoding a small image that is already in the target format can make it bigger
+        if unchanged and source_format == image_format and os.path.getsize(image_path) <= len(encoded):
+            with open(image_path, "rb") as image_file:
+                encoded = image_file.read()
+        return base64.b64encode(encoded).decode('utf-8'), IMAGE_MIME_TYPES[image_format]
+    except (OSError, ValueError, KeyError):
+        with open(image_path, "rb") as image_file:
+            data = image_file.read()
+        mime_type = mimetypes.guess_type(image_path)[0] or 'image/jpeg'
+        return base64.b64encode(data).decode('utf-8'), mime_type
+
+def prepare_image_payload(image_path):
+    """Worker entry point: return the encoded upload payload, or None for animated GIFs.
 
-def process_single_image(image_path, groq_client, vision_llm_provider, silent=False, log_file=None):
-    """Process a single image file to generate metadata."""
+    With OCR_IMAGES, a document-like image whose text can be recognized returns that text
+    (a str) instead, so it is described by the text model rather than the vision model.
+    """
+    if is_animated_gif(image_path):
+        return None
+    if OCR_IMAGES:
+        text = extract_document_image_text(image_path)
+        if text:
+            return text
+    return encode_image(image_path)
+
+def iter_image_payloads(image_paths, max_workers=IMAGE_WORKERS):
+    """Yield (image_path, future) pairs in input order while a process pool encodes ahead.
+
+    At most 2 * max_workers payloads are in flight, so CPU-bound decoding overlaps with
+    the network requests of the caller without holding every payload in memory. An image
+    that takes longer than the extraction timeout fails with ExtractionTimeout.
+    """
+    if not image_paths:
+        return
+    with ExtractionPool(max_workers=min(max_workers, len(image_paths))) as executor:
+        pending = deque()
+        paths = iter(image_paths)
+        while True:
+            while len(pending) < 2 * max_workers:
+                image_path = next(paths, None)
+                if image_path is None:
+                    break
+                pending.append((image_path, executor.submit(prepare_image_payload, image_path)))
+            if not pending:
+                return
+            yield pending.popleft()
+
+def process_single_image(image_path, vision_llm_provider, silent=False, log_file=None, text_inference=None, image_payload=None, progress=None):
+    """Process a single image file to generate metadata.
+
+    `image_payload` is an already encoded (base64_data, mime_type) tuple; if omitted the
+    image is encoded here. A str payload is the OCR text of a document-like image, which is
+    described by the text model instead. If `progress` is given, a task is added to that
+    shared progress display instead of opening a new one.
+    """
+    if isinstance(image_payload, str):
+        if text_inference is not None:
+            return process_single_text_file((image_path, image_payload), text_inference, silent=silent, log_file=log_file, progress=progress)
+        image_payload = None
     start_time = time.time()
 
-    with Progress(
-        TextColumn("[progress.description]{task.description}"),
-        BarColumn(),
-        TimeElapsedColumn()
-    ) as progress:
+    def generate(progress):
         task_id = progress.add_task(f"Processing {os.path.basename(image_path)}", total=1.0)
-        
+
         if is_animated_gif(image_path):
-            foldername = "animated_gifs"
-            filename = os.path.basename(image_path)
-            description = "Animated GIF (not processed by AI)"
-        else:
-            foldername, filename, description = generate_image_metadata(image_path, progress, task_id, groq_client, vision_llm_provider)
-    
+            progress.update(task_id, completed=1.0)
+            return "animated_gifs", os.path.basename(image_path), "Animated GIF (not processed by AI)"
+        return generate_image_metadata(image_path, progress, task_id, vision_llm_provider, text_inference=text_inference, image_payload=image_payload)
+
+    if progress is not None:
+        foldername, filename, description = generate(progress)
+    else:
+        with Progress(
+            TextColumn("[progress.description]{task.description}"),
+            BarColumn(),
+            TimeElapsedColumn()
+        ) as progress:
+            foldername, filename, description = generate(progress)
+
     end_time = time.time()
     time_taken = end_time - start_time
 
     message = f"File: {image_path}\nTime taken: {time_taken:.2f} seconds\nDescription: {description}\nFolder name: {foldername}\nGenerated filename: {filename}\n"
-    if silent:
-        if log_file:
-            with open(log_file, 'a') as f:
-                f.write(message + '\n')
-    else:
-        print(message)
+    log_message(message, silent, log_file, path=image_path, stage='describe', duration=round(time_taken, 3),
+                bytes=file_size(image_path), cache_hit=False, folder=foldername, filename=filename)
     return {
         'file_path': image_path,
         'foldername': foldername,
@@ -54,55 +146,85 @@ def process_single_image(image_path, groq_client, vision_llm_provider, silent=Fa
         'description': description
     }
 
-def process_image_files(image_files, groq_client, vision_llm_provider, silent=False, log_file=None):
-    """Process image files sequentially."""
+def process_image_files(image_files, vision_llm_provider, silent=False, log_file=None, cache=None, text_inference=None):
+    """Process image files, reusing cached metadata for unchanged files.
+
+    Vision requests are made sequentially while uncached images are decoded, downscaled
+    and encoded ahead of time in a process pool.
+    """
     results = []
+    vision_model = get_vision_llm(vision_llm_provider)
+    cached = {}
+    if cache:
+        for image_file in image_files:
+            data = cache.get(image_file, vision_model, IMAGE_PROMPT_VERSION)
+            if data is not None:
+                cached[image_file] = data
+                log_message(f"Cached metadata: {image_file}", silent, log_file, level='debug', path=image_file, stage='describe', cache_hit=True)
+    payloads = iter_image_payloads([fp for fp in image_files if fp not in cached])
     for image_file in image_files:
         try:
-            data = process_single_image(image_file, groq_client, vision_llm_provider, silent=silent, log_file=log_file)
+            data = cached.get(image_file)
+            if data is None:
+                _, payload_future = next(payloads)
+                data = process_single_image(image_file, vision_llm_provider, silent=silent, log_file=log_file, text_inference=text_inference, image_payload=payload_future.result())
+                if cache:
+                    cache.put(data, vision_model, IMAGE_PROMPT_VERSION)
             results.append(data)
         except Exception as e:
             message = f"Error processing image file {image_file}: {str(e)}"
-            if silent:
-                if log_file:
-                    with open(log_file, 'a') as f:
-                        f.write(message + '\n')
-            else:
-                print(message)
+            log_message(message, silent, log_file, level='error', path=image_file, stage='describe', error=str(e))
     return results
 
-def generate_image_metadata(image_path, progress, task_id, groq_client, vision_llm_provider):
-    """Generate description, folder name, and filename for an image file."""
+def generate_image_metadata(image_path, progress, task_id, vision_llm_provider, text_inference=None, image_payload=None):
+    """Generate description, folder name, and filename for an image file.
+
+    The image is uploaded once and the vision model is asked for all three fields as JSON.
+    If the response cannot be parsed, it is kept as the description and the filename and
+    category are derived from that text alone using a text model (`text_inference`, or a
+    cheap text model of the vision provider when none is given).
+    """
     total_steps = 3
-    
+
     # Encode the image
-    base64_image = encode_image(image_path)
+    if image_payload is None:
+        image_payload = encode_image(image_path)
+    base64_image, mime_type = image_payload
 
     vision_model = get_vision_llm(vision_llm_provider)
 
-    # Step 1: Generate description using Vision LLM
-    description_prompt = "Please provide a detailed description of this image, focusing on the main subject and any important details."
-    description_response = groq_client.chat.completions.create(
-        messages=[
-            {
-                "role": "user",
-                "content": [
-                    {"type": "text", "text": description_prompt},
-                    {
-                        "type": "image_url",
-                        "image_url": {
-                            "url": f"data:image/jpeg;base64,{base64_image}",
-                        },
-                    },
-                ],
-            }
-        ],
-        model=vision_model,
-    )
-    description = description_response.choices[0].message.content.strip()
+    # Step 1: Generate description, filename and category with a single Vision LLM request
+    metadata_prompt = """Describe this image and return a JSON object with exactly these keys:
+- "description": a detailed description of the image, focusing on the main subject and any important details.
+- "filename": a specific and descriptive filename for the image. Maximum of 3 words, nouns only, connected with underscores. Do not start with verbs like 'depicts', 'shows', 'presents', and do not include data type words like 'image', 'jpg', 'png'.
+- "category": a general category or theme that best represents the main subject, used as the folder name. Maximum of 2 words, nouns only. Do not include specific details, words from the filename, or generic terms like 'untitled' or 'unknown'.
+
+Example:
+{"description": "A photo of a sunset over the mountains.", "filename": "sunset_over_mountains", "category": "landscapes"}
+
+Output only the JSON object, without any additional text."""
+    response_text = get_llm_response(vision_model, metadata_prompt, image_data=base64_image,
+                                     provider=vision_llm_provider, mime_type=mime_type, path=image_path)
+    if response_text is None:
+        raise RuntimeError("no response from the vision model")
     progress.update(task_id, advance=1 / total_steps)
 
-    # Step 2: Generate filename using Vision LLM
+    data = parse_json_response(response_text, required_keys=('description', 'filename', 'category'))
+    if data is not None:
+        progress.update(task_id, completed=1.0)
+        description = data['description'].strip()
+        sanitized_filename = sanitize_filename(data['filename'], max_words=3)
+        sanitized_foldername = sanitize_filename(data['category'], max_words=2)
+        return sanitized_foldername, sanitized_filename, description
+
+    # Fallback: treat the response as the description and ask a text model for the rest
+    description = response_text
+    if text_inference is None:
+        fallback_model = get_fallback_text_llm(vision_llm_provider)
+        def text_inference(prompt):
+            return get_llm_response(fallback_model, prompt, provider=vision_llm_provider, path=image_path)
+
+    # Step 2: Generate filename from the description
     filename_prompt = f"""Based on the description below, generate a specific and descriptive filename for the image.
     Limit the filename to a maximum of 3 words. Use nouns and avoid starting with verbs like 'depicts', 'shows', 'presents', etc.
     Do not include any data type words like 'image', 'jpg', 'png', etc. Use only letters and connect words with underscores.
@@ -118,28 +240,11 @@ def generate_image_metadata(image_path, progress, task_id, groq_client, vision_l
     Output only the filename, without any additional text.
 
     Filename:"""
-    filename_response = groq_client.chat.completions.create(
-        messages=[
-            {
-                "role": "user",
-                "content": [
-                    {"type": "text", "text": filename_prompt},
-                    {
-                        "type": "image_url",
-                        "image_url": {
-                            "url": f"data:image/jpeg;base64,{base64_image}",
-                        },
-                    },
-                ],
-            }
-        ],
-        model=vision_model,
-    )
-    filename = filename_response.choices[0].message.content.strip()
+    filename = text_inference(filename_prompt) or ''
     filename = re.sub(r'^Filename:\s*', '', filename, flags=re.IGNORECASE).strip()
     progress.update(task_id, advance=1 / total_steps)
 
-    # Step 3: Generate folder name from description using Vision LLM
+    # Step 3: Generate folder name from the description
     foldername_prompt = f"""Based on the description below, generate a general category or theme that best represents the main subject of this image.
     This will be used as the folder name. Limit the category to a maximum of 2 words. Use nouns and avoid verbs.
     Do not include specific details, words from the filename, or any generic terms like 'untitled' or 'unknown'.
@@ -161,28 +266,11 @@ def generate_image_metadata(image_path, progress, task_id, groq_client, vision_l
     Output only the category, without any additional text.
 
     Category:"""
-    foldername_response = groq_client.chat.completions.create(
-        messages=[
-            {
-                "role": "user",
-                "content": [
-                    {"type": "text", "text": foldername_prompt},
-                    {
-                        "type": "image_url",
-                        "image_url": {
-                            "url": f"data:image/jpeg;base64,{base64_image}",
-                        },
-                    },
-                ],
-            }
-        ],
-        model=vision_model,
-    )
-    foldername = foldername_response.choices[0].message.content.strip()
+    foldername = text_inference(foldername_prompt) or ''
     foldername = re.sub(r'^Category:\s*', '', foldername, flags=re.IGNORECASE).strip()
     progress.update(task_id, advance=1 / total_steps)
 
     sanitized_filename = sanitize_filename(filename, max_words=3)
     sanitized_foldername = sanitize_filename(foldername, max_words=2)
 
-    return sanitized_foldername, sanitized_filename, description
\ No newline at end of file
+    return sanitized_foldername, sanitized_filename, description
@@ -0,0 +1,132 @@
+import os
+from file_utils import IMAGE_EXTENSIONS
+from extraction_pool import ExtractionPool, EXTRACT_WORKERS
+
+# Describe near-identical images (burst shots, resized or re-compressed copies) only once
+NEAR_DUPLICATES = os.getenv("LFO_NEAR_DUPLICATES", "1") != "0"
+# Maximum number of differing bits between the 256-bit pHashes of two near-duplicates
+NEAR_DUPLICATE_DISTANCE = int(os.getenv("LFO_NEAR_DUPLICATE_DISTANCE", "16"))
+HASH_SIZE = 16
+# Images whose thumbnail varies less than this (grayscale standard deviation) are not hashed
+MIN_DETAIL = 8.0
+
+_dct_matrices = {}
+
+def _dct_matrix(n):
+    """Return the n x n DCT-II basis (unnormalized), cached per size."""
+    matrix = _dct_matrices.get(n)
+    if matrix is None:
+        import numpy as np
+        k = np.arange(n)[:, None]
+        matrix = _dct_matrices[n] = np.cos(np.pi * (2 * np.arange(n)[None, :] + 1) * k / (2 * n))
+    return matrix
+
+def is_document_like(img):
+    """Return True for pages of text, scans and other mostly white, colourless images.
+
+    Their low frequencies are dominated by the page layout rather than the content, so
+    unrelated pages hash close together; they are described one by one instead.
+    """
+    import numpy as np
+    thumb = img.convert('RGB').resize((128, 96))
+    saturation = np.asarray(thumb.convert('HSV'), dtype=np.uint8)[..., 1]
+    gray = np.asarray(thumb.convert('L'), dtype=np.uint8)
+    return saturation.mean() < 20 and (gray > 200).mean() >= 0.5
+
+def compute_phash(image_path, hash_size=HASH_SIZE):
+    """Return the perceptual hash of an image as an int of hash_size * hash_size bits.
+
+    The image is reduced to a (4 * hash_size)-pixel square grayscale thumbnail and each bit
+    records whether a low-frequency DCT coefficient is above the median, which survives
+    resizing and re-compression. Returns None for low-detail and document-like images,
+    which are never treated as near-duplicates.
+    """
+    import numpy as np
+    from PIL import Image, ImageOps
+    size = hash_size * 4
+    with Image.open(image_path) as img:
+        # Let the JPEG decoder downscale while decoding instead of decoding full size
+        img.draft('RGB', (size * 4, size * 4))
+        img = ImageOps.exif_transpose(img)
+        if is_document_like(img):
+            return None
+        small = img.convert('L').resize((size, size), Image.LANCZOS)
+    pixels = np.asarray(small, dtype=np.float64)
+    if pixels.std() < MIN_DETAIL:
+        return None
+    dct = _dct_matrix(size)
+    coefficients = (dct @ pixels @ dct.T)[:hash_size, :hash_size].flatten()
+    # The DC term only reflects overall brightness, so it does not move the median
+    bits = coefficients > np.median(coefficients[1:])
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+def hamming_distance(a, b):
+    return bin(a ^ b).count('1')
+
+class BKTree:
+    """A Burkhard-Keller tree over hashes for finding all items within a Hamming radius.
+
+    Lookups only visit children whose edge distance is within `radius` of the query's
+    distance to the node (triangle inequality), instead of comparing against every item.
+    """
+
+    def __init__(self):
+        self._root = None  # [hash, item, {distance: child}]
+
+    def add(self, hash_value, item):
+        node = [hash_value, item, {}]
+        if self._root is None:
+            self._root = node
+            return
+        current = self._root
+        while True:
+            distance = hamming_distance(hash_value, current[0])
+            child = current[2].get(distance)
+            if child is None:
+                current[2][distance] = node
+                return
+            current = child
+
+    def search(self, hash_value, radius):
+        """Return (distance, item) pairs for every hash within radius, closest first."""
+        if self._root is None:
+            return []
+        matches = []
+        stack = [self._root]
+        while stack:
+            node_hash, item, children = stack.pop()
+            distance = hamming_distance(hash_value, node_hash)
+            if distance <= radius:
+                matches.append((distance, item))
+            for edge, child in children.items():
+                if distance - radius <= edge <= distance + radius:
+                    stack.append(child)
+        return sorted(matches, key=lambda match: match[0])
+
+def find_near_duplicate_images(file_paths, radius=NEAR_DUPLICATE_DISTANCE, max_workers=EXTRACT_WORKERS):
+    """Split out images that are near-duplicates of another image in file_paths.
+
+    Images are hashed in worker processes and visited in sorted path order; each one either
+    joins the closest representative within `radius` or becomes a representative itself.
+    Returns (remaining_paths, near_duplicates) like dedup.deduplicate: near_duplicates maps
+    each representative to the images that should share its metadata.
+    """
+    image_paths = sorted(fp for fp in file_paths if os.path.splitext(fp.lower())[1] in IMAGE_EXTENSIONS)
+    if len(image_paths) < 2:
+        return file_paths, {}
+    with ExtractionPool(max_workers=min(max_workers, len(image_paths))) as pool:
+        hashes = pool.map(compute_phash, image_paths)
+
+    tree = BKTree()
+    near_duplicates = {}
+    for image_path, hash_value in zip(image_paths, hashes):
+        if hash_value is None:
+            continue
+        matches = tree.search(hash_value, radius)
+        if matches:
+            near_duplicates.setdefault(matches[0][1], []).append(image_path)
+        else:
+            tree.add(hash_value, image_path)
+
+    skipped = {path for paths in near_duplicates.values() for path in paths}
+    return [fp for fp in file_paths if fp not in skipped], near_duplicates
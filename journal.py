@@ -0,0 +1,100 @@
+import os
+import json
+import time
+import sqlite3
+
+JOURNAL_FILE_NAME = '.run_journal.sqlite'
+
+class RunJournal:
+    """Write-ahead journal of the operations of a run, stored in the output directory.
+
+    The planned operations are written before any of them is executed, and completed
+    operations are marked as they finish (committed in small batches). If the run dies,
+    the journal still holds the plan, so a resumed run executes only what is left instead
+    of planning (and inferring) everything again. Inferred metadata is made durable
+    separately, file by file, by the metadata cache.
+    """
+
+    def __init__(self, output_path, flush_every=100, flush_interval=1.0):
+        self.db_path = os.path.join(output_path, JOURNAL_FILE_NAME)
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self._conn = None
+        self._done = []
+        self._last_flush = time.monotonic()
+        if os.path.exists(self.db_path):
+            self._connect()
+
+    def _connect(self):
+        os.makedirs(os.path.dirname(self.db_path) or '.', exist_ok=True)
+        self._conn = sqlite3.connect(self.db_path)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('CREATE TABLE IF NOT EXISTS run (mode TEXT NOT NULL)')
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS operations (
+                seq INTEGER PRIMARY KEY,
+                operation TEXT NOT NULL,
+                done INTEGER NOT NULL DEFAULT 0
+            )"""
+        )
+        self._conn.commit()
+
+    def start(self, mode, operations):
+        """Record the plan of a new run, replacing any previous journal.
+
+        Each operation gets a 'seq' key identifying it in the journal.
+        """
+        if self._conn is None:
+            self._connect()
+        for seq, operation in enumerate(operations):
+            operation['seq'] = seq
+        with self._conn:
+            self._conn.execute('DELETE FROM run')
+            self._conn.execute('DELETE FROM operations')
+            self._conn.execute('INSERT INTO run VALUES (?)', (mode,))
+            self._conn.executemany(
+                'INSERT INTO operations (seq, operation) VALUES (?, ?)',
+                [(operation['seq'], json.dumps(operation)) for operation in operations]
+            )
+
+    def unfinished(self, mode):
+        """Return (completed, pending) operations of an interrupted run in this mode, or None."""
+        if self._conn is None:
+            return None
+        row = self._conn.execute('SELECT mode FROM run').fetchone()
+        if row is None or row[0] != mode:
+            return None
+        completed, pending = [], []
+        for operation, done in self._conn.execute('SELECT operation, done FROM operations ORDER BY seq'):
+            (completed if done else pending).append(json.loads(operation))
+        return completed, pending
+
+    def mark_done(self, operation):
+        """Mark an operation as completed; written out every flush_every operations or flush_interval seconds."""
+        if self._conn is None or 'seq' not in operation:
+            return
+        self._done.append((operation['seq'],))
+        if len(self._done) >= self.flush_every or time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        if self._conn is not None and self._done:
+            with self._conn:
+                self._conn.executemany('UPDATE operations SET done = 1 WHERE seq = ?', self._done)
+        self._done = []
+        self._last_flush = time.monotonic()
+
+    def clear(self):
+        """Remove the journal once its run has finished."""
+        self.close()
+        for suffix in ('', '-wal', '-shm'):
+            try:
+                os.remove(self.db_path + suffix)
+            except FileNotFoundError:
+                pass
+
+    def close(self):
+        if self._conn is not None:
+            self.flush()
+            self._conn.close()
+            self._conn = None
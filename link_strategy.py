@@ -0,0 +1,128 @@
+import os
+import shutil
+import tempfile
+
+# How organized files are materialized: auto, hardlink, reflink, symlink or copy
+LINK_STRATEGY = os.getenv("LFO_LINK_STRATEGY", "auto")
+LINK_STRATEGIES = ('hardlink', 'reflink', 'symlink', 'copy')
+# ioctl request that clones a file's extents on Linux (btrfs, XFS, ...)
+FICLONE = 0x40049409
+
+def _existing_ancestor(path):
+    path = os.path.abspath(path)
+    while not os.path.exists(path):
+        parent = os.path.dirname(path)
+        if parent == path:
+            break
+        path = parent
+    return path
+
+def _probe(directory, strategy):
+    """Return True if `strategy` works between two files inside directory."""
+    try:
+        probe_dir = tempfile.mkdtemp(prefix='.lfo_probe_', dir=directory)
+    except OSError:
+        return None  # Cannot tell
+    try:
+        source = os.path.join(probe_dir, 'source')
+        target = os.path.join(probe_dir, 'target')
+        with open(source, 'wb') as f:
+            f.write(b'probe')
+        if strategy == 'hardlink':
+            os.link(source, target)
+        elif strategy == 'symlink':
+            os.symlink(source, target)
+        elif strategy == 'reflink':
+            import fcntl
+            with open(source, 'rb') as src, open(target, 'wb') as dst:
+                fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+        return True
+    except (ImportError, OSError, NotImplementedError):
+        return False
+    finally:
+        shutil.rmtree(probe_dir, ignore_errors=True)
+
+class LinkStrategyError(Exception):
+    """A forced link strategy cannot be used for a file."""
+
+class LinkPlanner:
+    """Chooses how each file is materialized in an output directory.
+
+    Once the output directory exists, it is probed once for hardlink, reflink and symlink
+    support (nothing is written anywhere else), and each source directory's device is
+    looked up once. A file then gets the cheapest valid strategy: a hardlink on the same
+    filesystem (or a reflink where hardlinks are not supported), and a symlink across
+    filesystems, where neither is possible. Files are only copied when nothing else works
+    or the strategy is forced to 'copy'. A forced strategy that cannot be used raises
+    LinkStrategyError instead of falling back to a copy.
+    """
+
+    def __init__(self, output_path, strategy=None):
+        self.strategy = strategy or LINK_STRATEGY
+        self.output_path = os.path.abspath(output_path)
+        self.output_dev = os.stat(_existing_ancestor(self.output_path)).st_dev
+        self._support = {}
+        self._source_devs = {}
+
+    def supports(self, strategy):
+        """Return whether strategy works in the output directory, or None if it does not exist yet."""
+        if strategy == 'copy':
+            return True
+        if strategy not in self._support:
+            if not os.path.isdir(self.output_path):
+                return None  # Nothing is probed outside the output directory (e.g. on a dry run)
+            supported = _probe(self.output_path, strategy)
+            # If the probe cannot run, assume the usual support and let the executor fall back
+            self._support[strategy] = (strategy != 'reflink') if supported is None else supported
+        return self._support[strategy]
+
+    def same_device(self, source):
+        source_dir = os.path.dirname(source)
+        dev = self._source_devs.get(source_dir)
+        if dev is None:
+            try:
+                dev = os.stat(source_dir).st_dev
+            except OSError:
+                dev = self.output_dev
+            self._source_devs[source_dir] = dev
+        return dev == self.output_dev
+
+    def link_type(self, source):
+        """Return the strategy for linking source into the output directory."""
+        same_device = self.same_device(source)
+        if self.strategy in LINK_STRATEGIES:
+            if self.strategy in ('hardlink', 'reflink') and not same_device:
+                raise LinkStrategyError(f"Cannot {self.strategy} '{source}' into '{self.output_path}': they are on "
+                                        f"different filesystems. Use --link-strategy auto, symlink or copy.")
+            if self.supports(self.strategy) is False:
+                raise LinkStrategyError(f"The filesystem of '{self.output_path}' does not support {self.strategy}s. "
+                                        f"Use --link-strategy auto or copy.")
+            return self.strategy
+        preferred = ['hardlink', 'reflink', 'symlink'] if same_device else ['symlink']
+        for strategy in preferred:
+            if strategy in ('hardlink', 'reflink') and not same_device:
+                continue
+            supported = self.supports(strategy)
+            # Before the output directory exists, assume the usual support
+            if supported or (supported is None and strategy != 'reflink'):
+                return strategy
+        return 'copy'
+
+_planners = {}
+
+def set_link_strategy(strategy):
+    """Override LFO_LINK_STRATEGY ('auto' or one of LINK_STRATEGIES) for later planning."""
+    global LINK_STRATEGY
+    LINK_STRATEGY = strategy
+    _planners.clear()
+
+def copy_fallback_allowed():
+    """Return True if a failed hardlink or reflink may be replaced by a copy at execution time."""
+    return LINK_STRATEGY not in ('hardlink', 'reflink', 'symlink')
+
+def choose_link_type(source, output_path):
+    """Return the link strategy for source, using one LinkPlanner per output directory."""
+    planner = _planners.get(output_path)
+    if planner is None:
+        planner = _planners[output_path] = LinkPlanner(output_path)
+    return planner.link_type(source)
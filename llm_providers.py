@@ -0,0 +1,64 @@
+import os
+import threading
+
+# OpenAI-compatible endpoints of the supported providers. Each can be pointed elsewhere
+# with <PROVIDER>_BASE_URL (or all at once with LLM_BASE_URL), e.g. a local stand-in server.
+PROVIDERS = {
+    "groq": {"base_url": "https://api.groq.com/openai/v1", "api_key_env": "GROQ_API_KEY"},
+    "deepinfra": {"base_url": "https://api.deepinfra.com/v1/openai", "api_key_env": "DEEPINFRA_API_KEY"},
+    "deepseek": {"base_url": "https://api.deepseek.com", "api_key_env": "DEEPSEEK_API_KEY"},
+    "openai": {"base_url": None, "api_key_env": "OPENAI_API_KEY"},
+}
+
+DEFAULT_PROVIDER = "openai"
+
+class ProviderRegistry:
+    """Holds one long-lived, connection-pooled client per LLM provider."""
+
+    def __init__(self, timeout=None, connect_timeout=None, max_connections=None):
+        self.timeout = timeout if timeout is not None else float(os.getenv("LLM_TIMEOUT", "60"))
+        self.connect_timeout = connect_timeout if connect_timeout is not None else float(os.getenv("LLM_CONNECT_TIMEOUT", "10"))
+        self.max_connections = max_connections if max_connections is not None else int(os.getenv("LLM_MAX_CONNECTIONS", "20"))
+        self._clients = {}
+        self._lock = threading.Lock()
+
+    def _create_client(self, provider):
+        import httpx
+        import openai
+
+        config = PROVIDERS.get(provider, PROVIDERS[DEFAULT_PROVIDER])
+        base_url = (os.getenv(f"{provider.upper()}_BASE_URL")
+                    or os.getenv("LLM_BASE_URL")
+                    or config["base_url"])
+        # Local stand-in servers usually accept any key
+        api_key = os.getenv(config["api_key_env"]) or "not-needed"
+        http_client = httpx.Client(
+            timeout=httpx.Timeout(self.timeout, connect=self.connect_timeout),
+            limits=httpx.Limits(max_connections=self.max_connections,
+                                max_keepalive_connections=self.max_connections),
+        )
+        # Retries on rate limits, server errors and connection failures are handled by
+        # rate_limiter.retry_with_backoff, which also respects the provider's request rate
+        return openai.OpenAI(api_key=api_key, base_url=base_url, http_client=http_client, max_retries=0)
+
+    def get_client(self, provider=None):
+        """Return the shared client for a provider, creating it on first use."""
+        provider = provider or DEFAULT_PROVIDER
+        with self._lock:
+            client = self._clients.get(provider)
+            if client is None:
+                client = self._create_client(provider)
+                self._clients[provider] = client
+            return client
+
+    def close(self):
+        with self._lock:
+            for client in self._clients.values():
+                client.close()
+            self._clients.clear()
+
+_registry = ProviderRegistry()
+
+def get_client(provider=None):
+    """Return the pooled client of the default registry for a provider."""
+    return _registry.get_client(provider)
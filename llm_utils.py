@@ -1,65 +1,139 @@
-from litellm import completion
-import os
-from dotenv import load_dotenv
-import groq
-import openai
-
-load_dotenv()
-
-def get_llm_response(model, prompt, image_data=None, provider=None):
-    try:
-        if image_data:
-            if provider == "groq":
-                groq_client = groq.Groq(api_key=os.getenv("GROQ_API_KEY"))
-                response = groq_client.chat.completions.create(
-                    model="llama-3.2-11b-vision-preview",
-                    messages=[
-                        {
-                            "role": "user",
-                            "content": [
-                                {"type": "text", "text": prompt},
-                                {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{image_data}"}}
-                            ]
-                        }
-                    ]
-                )
-                return response.choices[0].message.content.strip()
-            elif provider == "openai":
-                openai.api_key = os.getenv("OPENAI_API_KEY")
-                response = openai.ChatCompletion.create(
-                    model="gpt-4-vision-preview",
-                    messages=[
-                        {
-                            "role": "user",
-                            "content": [
-                                {"type": "text", "text": prompt},
-                                {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{image_data}"}}
-                            ]
-                        }
-                    ]
-                )
-                return response.choices[0].message.content.strip()
-        else:
-            # Use LiteLLM for text tasks
-            messages = [{"role": "user", "content": prompt}]
-            response = completion(model=model, messages=messages)
-            return response.choices[0].message.content.strip()
-    except Exception as e:
-        print(f"Error in LLM response: {str(e)}")
-        return None
-
-def get_text_llm(provider):
-    if provider == "deepinfra":
-        return "deepinfra/Qwen/Qwen2.5-72B-Instruct"
-    elif provider == "deepseek":
-        return "deepseek-ai/deepseek-chat"
-    else:
-        return os.getenv("TEXT_LLM_MODEL", "gpt-3.5-turbo")
-
-def get_vision_llm(provider):
-    if provider == "groq":
-        return "llama-3.2-11b-vision-preview"
-    elif provider == "openai":
-        return "gpt-4-vision-preview"
-    else:
-        return os.getenv("VISION_LLM_MODEL", "gpt-4-vision-preview")
\ No newline at end of file
+import os
+import re
+import json
+import threading
+from rate_limiter import TokenBucket, retry_with_backoff
+from llm_providers import get_client
+from run_log import log_message
+
+# Default request budgets per provider, in requests per minute.
+# Override with e.g. GROQ_RPM=120 in the environment.
+DEFAULT_RATE_LIMITS = {
+    "deepinfra": 60,
+    "deepseek": 60,
+    "groq": 30,
+    "openai": 60,
+}
+
+_rate_limiters = {}
+_rate_limiters_lock = threading.Lock()
+
+def get_rate_limiter(provider):
+    """Return the shared token bucket for a provider."""
+    key = provider or "default"
+    with _rate_limiters_lock:
+        limiter = _rate_limiters.get(key)
+        if limiter is None:
+            rpm = int(os.getenv(f"{key.upper()}_RPM", DEFAULT_RATE_LIMITS.get(key, 60)))
+            limiter = TokenBucket(rpm, per=60.0)
+            _rate_limiters[key] = limiter
+        return limiter
+
+def get_llm_response(model, prompt, image_data=None, provider=None, mime_type="image/jpeg", path=None):
+    """Return the model's answer to prompt, or None if the request failed (the error is logged)."""
+    try:
+        if provider == "local" and not image_data:
+            # Offline CPU inference: no network, so no rate limiting or retries
+            from local_llm import get_local_model
+            return get_local_model().complete(prompt)
+        return retry_with_backoff(
+            lambda: _request_llm_response(model, prompt, image_data, provider, mime_type),
+            limiter=get_rate_limiter(provider)
+        )
+    except Exception as e:
+        log_message(f"Error in LLM response: {str(e)}", level='error', path=path, stage='describe',
+                    provider=provider, model=model, error=str(e))
+        return None
+
+def get_embeddings(texts, model, provider=None):
+    """Return one embedding vector per text from a provider's embeddings endpoint."""
+    def request():
+        response = get_client(provider).embeddings.create(model=model, input=texts)
+        return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+    return retry_with_backoff(request, limiter=get_rate_limiter(provider))
+
+def _request_llm_response(model, prompt, image_data=None, provider=None, mime_type="image/jpeg"):
+    client = get_client(provider)
+    if image_data:
+        content = [
+            {"type": "text", "text": prompt},
+            {"type": "image_url", "image_url": {"url": f"data:{mime_type};base64,{image_data}"}}
+        ]
+        model = model or get_vision_llm(provider)
+    else:
+        content = prompt
+        model = model or get_text_llm(provider)
+    response = client.chat.completions.create(
+        model=model,
+        messages=[{"role": "user", "content": content}]
+    )
+    return response.choices[0].message.content.strip()
+
+def get_text_llm(provider):
+    if provider == "deepinfra":
+        return "Qwen/Qwen2.5-72B-Instruct"
+    elif provider == "deepseek":
+        return "deepseek-chat"
+    elif provider == "local":
+        from local_llm import get_local_model_name
+        return get_local_model_name()
+    else:
+        return os.getenv("TEXT_LLM_MODEL", "gpt-3.5-turbo")
+
+def get_fallback_text_llm(provider):
+    """Return a cheap text-only model of a vision provider, for prompts that need no image."""
+    if provider == "groq":
+        return os.getenv("GROQ_TEXT_MODEL", "llama-3.1-8b-instant")
+    return os.getenv("FALLBACK_TEXT_LLM_MODEL", "gpt-4o-mini")
+
+def get_vision_llm(provider):
+    if provider == "groq":
+        return "llama-3.2-11b-vision-preview"
+    elif provider == "openai":
+        return "gpt-4-vision-preview"
+    else:
+        return os.getenv("VISION_LLM_MODEL", "gpt-4-vision-preview")
+
+def parse_json_response(response, required_keys=()):
+    """Extract a JSON object from an LLM response.
+
+    Tolerates markdown code fences and surrounding prose. Returns the parsed dict, or
+    None if no valid object is found or any of `required_keys` is missing or empty.
+    """
+    if not response:
+        return None
+    text = re.sub(r'```(?:json)?', '', response).strip()
+    start, end = text.find('{'), text.rfind('}')
+    if start == -1 or end <= start:
+        return None
+    try:
+        data = json.loads(text[start:end + 1])
+    except ValueError:
+        return None
+    if not isinstance(data, dict):
+        return None
+    for key in required_keys:
+        value = data.get(key)
+        if not isinstance(value, str) or not value.strip():
+            return None
+    return data
+
+def parse_json_array_response(response):
+    """Extract a JSON array of objects from an LLM response.
+
+    Tolerates markdown code fences and surrounding prose. Returns the list of dicts, or
+    None if no valid array is found.
+    """
+    if not response:
+        return None
+    text = re.sub(r'```(?:json)?', '', response).strip()
+    start, end = text.find('['), text.rfind(']')
+    if start == -1 or end <= start:
+        return None
+    try:
+        data = json.loads(text[start:end + 1])
+    except ValueError:
+        return None
+    if not isinstance(data, list):
+        return None
+    return [item for item in data if isinstance(item, dict)]
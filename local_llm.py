@@ -0,0 +1,61 @@
+import os
+import queue
+import threading
+
+# Path to a GGUF model file for offline, CPU-only text inference with llama.cpp
+LOCAL_MODEL_PATH = os.getenv("LOCAL_MODEL_PATH")
+# Independent model replicas; concurrent requests are spread across them
+LOCAL_LLM_INSTANCES = int(os.getenv("LOCAL_LLM_INSTANCES", "1"))
+LOCAL_LLM_CONTEXT = int(os.getenv("LOCAL_LLM_CONTEXT", "4096"))
+LOCAL_LLM_MAX_TOKENS = int(os.getenv("LOCAL_LLM_MAX_TOKENS", "512"))
+
+class LocalTextModel:
+    """A llama.cpp (GGUF) text model running on the CPU.
+
+    The model is loaded once per replica. Each replica serves one request at a time using
+    its share of the CPU cores, so with several replicas the files processed concurrently
+    by the text pipeline are inferred in parallel.
+    """
+
+    def __init__(self, model_path, instances=LOCAL_LLM_INSTANCES, n_threads=None, n_ctx=LOCAL_LLM_CONTEXT):
+        try:
+            from llama_cpp import Llama
+        except ImportError:
+            raise RuntimeError("The local text backend requires llama-cpp-python (pip install llama-cpp-python)")
+        if not model_path or not os.path.exists(model_path):
+            raise RuntimeError(f"Local model file not found: {model_path!r} (set LOCAL_MODEL_PATH)")
+
+        instances = max(1, instances)
+        if n_threads is None:
+            n_threads = int(os.getenv("LOCAL_LLM_THREADS", str(max(1, (os.cpu_count() or 1) // instances))))
+        self.model_path = model_path
+        self._replicas = queue.Queue()
+        for _ in range(instances):
+            self._replicas.put(Llama(model_path=model_path, n_ctx=n_ctx, n_threads=n_threads, verbose=False))
+
+    def complete(self, prompt, max_tokens=LOCAL_LLM_MAX_TOKENS):
+        """Run a chat completion on the next free replica and return the response text."""
+        llm = self._replicas.get()
+        try:
+            response = llm.create_chat_completion(
+                messages=[{"role": "user", "content": prompt}],
+                max_tokens=max_tokens,
+                temperature=0.2,
+            )
+        finally:
+            self._replicas.put(llm)
+        return response['choices'][0]['message']['content'].strip()
+
+_model = None
+_model_lock = threading.Lock()
+
+def get_local_model():
+    """Return the process-wide local model, loading it on first use."""
+    global _model
+    with _model_lock:
+        if _model is None:
+            _model = LocalTextModel(LOCAL_MODEL_PATH)
+        return _model
+
+def get_local_model_name():
+    return f"local/{os.path.basename(LOCAL_MODEL_PATH)}" if LOCAL_MODEL_PATH else "local"
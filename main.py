@@ -1,26 +1,36 @@
 import os
+import sys
+import json
 import time
+import argparse
 from dotenv import load_dotenv
+
+# Load environment variables before any module reads its configuration from them
+load_dotenv()
+
 from llm_utils import get_llm_response, get_text_llm, get_vision_llm
-import groq
-import requests
 
 from file_utils import (
     display_directory_tree,
     collect_file_paths,
+    iter_file_paths,
     separate_files_by_type,
-    read_file_data
+    extract_files_data
 )
 
 from data_processing_common import (
     compute_operations,
     execute_operations,
+    summarize_link_types,
+    DestinationNamer,
     process_files_by_date,
     process_files_by_type,
 )
 
 from text_data_processing import (
-    process_text_files
+    process_text_files,
+    TEXT_PROMPT_VERSION,
+    OUTPUT_TOKENS_PER_DOCUMENT
 )
 
 from image_data_processing import (
@@ -28,20 +38,14 @@ from image_data_processing import (
     process_image_files
 )
 
-from output_filter import filter_specific_output  # Import the context manager
-
-def ensure_nltk_data():
-    """Ensure that NLTK data is downloaded efficiently and quietly."""
-    import nltk
-    nltk.download('stopwords', quiet=True)
-    nltk.download('punkt', quiet=True)
-    nltk.download('wordnet', quiet=True)
-
-# Load environment variables
-load_dotenv()
-
-# Initialize GROQ client for vision tasks
-groq_client = groq.Groq(api_key=os.getenv("GROQ_API_KEY"))
+from metadata_cache import MetadataCache
+from file_index import FileIndex
+from journal import RunJournal
+from link_strategy import set_link_strategy, LinkStrategyError, LINK_STRATEGY
+from dedup import deduplicate, expand_duplicates, DEDUP_POLICY
+from image_hashing import find_near_duplicate_images, NEAR_DUPLICATES
+from pipeline import run_content_pipeline
+from run_log import log_message, configure_run_log
 
 # Initialize DeepInfra client for text tasks
 DEEPINFRA_API_KEY = os.getenv("DEEPINFRA_API_KEY")
@@ -52,31 +56,244 @@ DEEPSEEK_API_KEY = os.getenv("DEEPSEEK_API_KEY")
 DEEPSEEK_MODEL = get_text_llm("deepseek")
 
 def deepinfra_chat_completion(prompt):
-    return get_llm_response(DEEPINFRA_MODEL, prompt)
+    return get_llm_response(DEEPINFRA_MODEL, prompt, provider="deepinfra")
 
 def deepseek_chat_completion(prompt):
-    return get_llm_response(DEEPSEEK_MODEL, prompt)
+    return get_llm_response(DEEPSEEK_MODEL, prompt, provider="deepseek")
 
 def initialize_models(text_llm_provider, vision_llm_provider):
     """Initialize the models if they haven't been initialized yet."""
     print("**----------------------------------------------**")
     print(f"**       Text LLM (DeepInfra): {DEEPINFRA_MODEL}**")
     print(f"**       Text LLM (DeepSeek): {DEEPSEEK_MODEL}  **")
+    if text_llm_provider == "local":
+        from local_llm import get_local_model
+        print(f"**       Text LLM (Local): {get_text_llm('local')}")
+        get_local_model()  # Load the model once, before any file is processed
     print(f"**       Vision LLM: {get_vision_llm(vision_llm_provider)}         **")
     print("**----------------------------------------------**")
 
-# Load environment variables
-load_dotenv()
+# Number of files processed concurrently in content mode (1 = sequential)
+MAX_WORKERS = int(os.getenv("LFO_MAX_WORKERS", "1"))
+
+# Number of short text documents packed into one LLM prompt (1 = no batching)
+BATCH_SIZE = int(os.getenv("LFO_BATCH_SIZE", "1"))
+
+# Generate text metadata with a single JSON-returning LLM call (set to 0 for the three-step prompts)
+STRUCTURED_METADATA = os.getenv("LFO_STRUCTURED_METADATA", "1") != "0"
+
+# Only plan and link files that are new or changed since the last run (set to 0 to re-plan everything)
+INCREMENTAL = os.getenv("LFO_INCREMENTAL", "1") != "0"
+
+# Group similar descriptions into shared category folders using embeddings
+CLUSTER_CATEGORIES = os.getenv("LFO_CLUSTER_CATEGORIES", "0") == "1"
+
+def generate_content_metadata(file_paths, text_llm_provider, vision_llm_provider, max_workers=MAX_WORKERS, structured=STRUCTURED_METADATA, batch_size=BATCH_SIZE, silent=False, log_file=None):
+    """Generate description, folder name and filename metadata for image and text files.
+
+    Returns a (data_list, failed) tuple, where failed counts the image and text files that
+    were left out because they could not be read or described.
+    """
+    # Separate files by type
+    image_files, text_files = separate_files_by_type(file_paths)
+
+    # Create the text_llm_wrapper with the selected provider
+    text_llm_wrapper = get_text_llm_wrapper(text_llm_provider)
+    if text_llm_provider == 'local':
+        # A batched answer must fit in the local model's output limit, or it is cut off and retried
+        from local_llm import LOCAL_LLM_MAX_TOKENS
+        batch_size = min(batch_size, max(1, LOCAL_LLM_MAX_TOKENS // OUTPUT_TOKENS_PER_DOCUMENT))
+
+    # Reuse metadata from previous runs for files whose content has not changed
+    metadata_cache = MetadataCache()
+    text_model = get_text_llm(text_llm_provider)
+
+    # Prepare text tuples for processing
+    text_tuples = []
+    cached_texts = []
+    uncached_text_files = []
+    for fp in text_files:
+        cached = metadata_cache.get(fp, text_model, TEXT_PROMPT_VERSION)
+        if cached is not None:
+            cached_texts.append(cached)
+            log_message(f"Cached metadata: {fp}", silent, log_file, level='debug', path=fp, stage='describe', cache_hit=True)
+            continue  # Skip reading and summarizing unchanged files
+        uncached_text_files.append(fp)
+
+    # Read the raw file contents in worker processes; the metadata step summarizes them
+    text_contents = extract_files_data(uncached_text_files)
+    for fp, text_content in zip(uncached_text_files, text_contents):
+        if text_content is None:
+            message = f"Unsupported or unreadable text file format: {fp}"
+            log_message(message, silent, log_file, level='warning', path=fp, stage='extract', error='unreadable')
+            continue  # Skip unsupported or unreadable files
+        text_tuples.append((fp, text_content))
+
+    # Process files sequentially
+    data_images = process_image_files(image_files, vision_llm_provider, silent=silent, log_file=log_file, cache=metadata_cache, text_inference=text_llm_wrapper)
+
+    data_texts = cached_texts + process_text_files(text_tuples, text_llm_wrapper, silent=silent, log_file=log_file, cache=metadata_cache, model=text_model, max_workers=max_workers, structured=structured, batch_size=batch_size)
+    metadata_cache.close()
+
+    failed = len(image_files) + len(text_files) - len(data_images) - len(data_texts)
+    return data_images + data_texts, failed
+
+def stream_content_mode(file_paths, removal_operations, output_path, file_index, text_llm_provider, vision_llm_provider,
+                        incremental=INCREMENTAL, max_workers=MAX_WORKERS, structured=STRUCTURED_METADATA, silent=False, log_file=None):
+    """Organize files by content, linking each file as soon as its metadata is ready.
+
+    file_paths may be a generator that is still walking the input directory (see
+    iter_file_paths), so the first files are processed before the walk finishes. That is
+    only possible without a file index diff: incremental runs walk the whole input up
+    front, since deleted files are only known once the walk is complete.
+
+    Returns a (completed, failed) tuple of operation counts.
+    """
+    os.makedirs(output_path, exist_ok=True)
+    file_index.record(execute_operations(removal_operations, silent=silent, log_file=log_file))
+    metadata_cache = MetadataCache()
+    try:
+        return run_content_pipeline(
+            file_paths,
+            output_path,
+            vision_llm_provider,
+            get_text_llm_wrapper(text_llm_provider),
+            get_text_llm(text_llm_provider),
+            cache=metadata_cache,
+            file_index=file_index,
+            renamed_files=DestinationNamer(file_index.destinations() if incremental else (), released={op['destination'] for op in removal_operations}),
+            max_workers=max_workers,
+            structured=structured,
+            silent=silent,
+            log_file=log_file
+        )
+    finally:
+        metadata_cache.close()
+
+def resume_run(journal, file_index, mode, silent=False, log_file=None):
+    """Finish the operations of an interrupted run recorded in the journal.
+
+    Returns a (completed, failed) tuple of operation counts, or None if there is nothing
+    to resume for this mode.
+    """
+    unfinished = journal.unfinished(mode)
+    if unfinished is None:
+        return None
+    completed_operations, pending_operations = unfinished
+    message = f"Resuming the interrupted run: {len(completed_operations)} operations done, {len(pending_operations)} left"
+    log_message(message, silent, log_file)
+    newly_completed = execute_operations(pending_operations, silent=silent, log_file=log_file, journal=journal)
+    file_index.record(completed_operations + newly_completed)
+    journal.clear()
+    return len(completed_operations) + len(newly_completed), len(pending_operations) - len(newly_completed)
+
+def collapse_duplicates(file_paths, silent=False, log_file=None):
+    """Keep one file per distinct content, for the 'collapse' dedup policy.
+
+    Runs on every collected file, before the file index diff, so that a new copy of an
+    already organized file is not linked either.
+    """
+    file_paths, duplicates = deduplicate(file_paths)
+    if duplicates:
+        message = f"Skipping {sum(len(paths) for paths in duplicates.values())} duplicates of {len(duplicates)} files"
+        log_message(message, silent, log_file)
+    return file_paths
+
+def plan_operations(mode, file_paths, removal_operations, output_path, file_index, text_llm_provider=None, vision_llm_provider=None,
+                    incremental=INCREMENTAL, max_workers=MAX_WORKERS, structured=STRUCTURED_METADATA, batch_size=BATCH_SIZE,
+                    cluster_categories=CLUSTER_CATEGORIES, dedup_policy=DEDUP_POLICY, clusters=None, silent=False, log_file=None):
+    """Compute the file operations for the selected mode, preceded by any stale-link removals.
+
+    Returns an (operations, failed) tuple; failed counts the files that could not be
+    described, including duplicates that would have shared their metadata. Planning
+    changes nothing on disk. With cluster_categories, the updated clusters are
+    stored in the clusters dict, if one is given, for save_planned_clusters to write once
+    the operations have been executed.
+    """
+    duplicates = {}
+    failed = 0
+    # With 'collapse' the caller already dropped duplicates (see collapse_duplicates)
+    if mode == 'content' and dedup_policy == 'link_all':
+        file_paths, duplicates = deduplicate(file_paths)
+        if duplicates:
+            message = f"Found {sum(len(paths) for paths in duplicates.values())} duplicates of {len(duplicates)} files"
+            log_message(message, silent, log_file)
+    if mode == 'content' and dedup_policy != 'off' and NEAR_DUPLICATES:
+        # Burst shots and resized or re-compressed copies share their representative's metadata
+        file_paths, near_duplicates = find_near_duplicate_images(file_paths)
+        for representative, paths in near_duplicates.items():
+            duplicates.setdefault(representative, []).extend(paths)
+        if near_duplicates:
+            message = f"Found {sum(len(paths) for paths in near_duplicates.values())} near-duplicates of {len(near_duplicates)} images"
+            log_message(message, silent, log_file)
+
+    if mode == 'content':
+        # Generate metadata for every file that needs to be organized
+        all_data, failed = generate_content_metadata(
+            file_paths,
+            text_llm_provider,
+            vision_llm_provider,
+            max_workers=max_workers,
+            structured=structured,
+            batch_size=batch_size,
+            silent=silent,
+            log_file=log_file
+        )
+
+        if cluster_categories:
+            # Replace the per-file folder names with one name per group of similar files
+            from category_clustering import assign_cluster_categories
+            centroids, names = assign_cluster_categories(all_data, get_text_llm_wrapper(text_llm_provider), output_path=output_path)
+            if clusters is not None and names:
+                clusters.update(centroids=centroids, names=names)
+
+        if duplicates:
+            # Duplicates reuse the metadata of their representative instead of being inferred again
+            described = {data['file_path'] for data in all_data}
+            failed += sum(len(paths) for representative, paths in duplicates.items() if representative not in described)
+            all_data = expand_duplicates(all_data, duplicates)
+
+        # Prepare for copying and renaming; keep clear of links made by earlier runs
+        renamed_files = DestinationNamer(file_index.destinations() if incremental else (), released={op['destination'] for op in removal_operations})
+        processed_files = set()
+
+        # Compute the operations
+        operations = compute_operations(
+            all_data,
+            output_path,
+            renamed_files,
+            processed_files,
+            None  # No client is needed to compute the operations
+        )
+    elif mode == 'date':
+        # Process files by date
+        operations = process_files_by_date(file_paths, output_path, dry_run=False, silent=silent, log_file=log_file)
+    elif mode == 'type':
+        # Process files by type
+        operations = process_files_by_type(file_paths, output_path, dry_run=False, silent=silent, log_file=log_file)
+    else:
+        raise ValueError(f"Invalid mode selected: {mode}")
 
-# Initialize GROQ client
-client = groq.Groq(api_key=os.getenv("GROQ_API_KEY"))
+    # Stale links are removed before any new ones are created
+    return removal_operations + operations, failed
+
+def save_planned_clusters(output_path, clusters):
+    """Save the category clusters computed by plan_operations, if there are any."""
+    if clusters:
+        from category_clustering import save_clusters
+        save_clusters(output_path, clusters['centroids'], clusters['names'])
 
 def simulate_directory_tree(operations, base_path):
     """Simulate the directory tree based on the proposed operations."""
     tree = {}
     for op in operations:
+        if op['link_type'] == 'remove':
+            continue
         rel_path = os.path.relpath(op['destination'], base_path)
         parts = rel_path.split(os.sep)
+        if op['link_type'] != 'hardlink':
+            # Show files that will not be hardlinked, so copies in particular stand out
+            parts[-1] = f"{parts[-1]} ({op['link_type']})"
         current_level = tree
         for part in parts:
             if part not in current_level:
@@ -133,7 +350,8 @@ def get_text_llm_selection():
         print("Please choose the LLM for text processing:")
         print("1. DeepInfra (Qwen/Qwen2.5-72B-Instruct)")
         print("2. DeepSeek")
-        response = input("Enter 1 or 2 (or type '/exit' to exit): ").strip()
+        print("3. Local (llama.cpp GGUF model on the CPU, offline)")
+        response = input("Enter 1, 2, or 3 (or type '/exit' to exit): ").strip()
         if response == '/exit':
             print("Exiting program.")
             exit()
@@ -141,8 +359,10 @@ def get_text_llm_selection():
             return "deepinfra"
         elif response == '2':
             return "deepseek"
+        elif response == '3':
+            return "local"
         else:
-            print("Invalid selection. Please enter 1 or 2. To exit, type '/exit'.")
+            print("Invalid selection. Please enter 1, 2, or 3. To exit, type '/exit'.")
 
 def get_vision_llm_selection():
     """Prompt the user to select an LLM for vision processing."""
@@ -169,9 +389,6 @@ def get_text_llm_wrapper(text_llm_provider):
     return wrapper
 
 def main():
-    # Ensure NLTK data is downloaded efficiently and quietly
-    ensure_nltk_data()
-
     # Start with dry run set to True
     dry_run = True
 
@@ -183,6 +400,7 @@ def main():
         log_file = 'operation_log.txt'
     else:
         log_file = None
+    configure_run_log(log_file)
 
     while True:
         # Paths configuration
@@ -193,20 +411,12 @@ def main():
         input_path = input("Enter the path of the directory you want to organize: ").strip()
         while not os.path.exists(input_path):
             message = f"Input path {input_path} does not exist. Please enter a valid path."
-            if silent_mode:
-                with open(log_file, 'a') as f:
-                    f.write(message + '\n')
-            else:
-                print(message)
+            log_message(message, silent_mode, log_file)
             input_path = input("Enter the path of the directory you want to organize: ").strip()
 
         # Confirm successful input path
         message = f"Input path successfully uploaded: {input_path}"
-        if silent_mode:
-            with open(log_file, 'a') as f:
-                f.write(message + '\n')
-        else:
-            print(message)
+        log_message(message, silent_mode, log_file)
         if not silent_mode:
             print("-" * 50)
 
@@ -218,25 +428,23 @@ def main():
 
         # Confirm successful output path
         message = f"Output path successfully set to: {output_path}"
-        if silent_mode:
-            with open(log_file, 'a') as f:
-                f.write(message + '\n')
-        else:
-            print(message)
+        log_message(message, silent_mode, log_file)
         if not silent_mode:
             print("-" * 50)
 
+        # The file index and journal record absolute paths, independent of the working directory
+        input_path = os.path.abspath(input_path)
+        output_path = os.path.abspath(output_path)
+
         # Start processing files
         start_time = time.time()
         file_paths = collect_file_paths(input_path)
+        if DEDUP_POLICY == 'collapse':
+            file_paths = collapse_duplicates(file_paths, silent=silent_mode, log_file=log_file)
         end_time = time.time()
 
         message = f"Time taken to collect file paths: {end_time - start_time:.2f} seconds"
-        if silent_mode:
-            with open(log_file, 'a') as f:
-                f.write(message + '\n')
-        else:
-            print(message)
+        log_message(message, silent_mode, log_file)
         if not silent_mode:
             print("-" * 50)
             print("Directory tree before organizing:")
@@ -248,6 +456,28 @@ def main():
         while True:
             mode = get_mode_selection()
 
+            # Restrict the run to new or changed files and unlink deleted ones
+            file_index = FileIndex(output_path, mode)
+            journal = RunJournal(output_path)
+            if journal.unfinished(mode) is not None and get_yes_no("An interrupted run was found for this directory. Would you like to resume it? (yes/no): "):
+                completed, failed = resume_run(journal, file_index, mode, silent=silent_mode, log_file=log_file)
+                file_index.close()
+                message = f"The files have been organized successfully ({completed} linked, {failed} failed)."
+                if silent_mode:
+                    log_message(message, True, log_file)
+                else:
+                    print("-" * 50)
+                    print(message)
+                    print("-" * 50)
+                break  # Exit the sorting method loop
+            if INCREMENTAL:
+                mode_file_paths, removal_operations = file_index.diff(file_paths)
+                message = f"Incremental run: {len(mode_file_paths)} new or changed files, {len(removal_operations)} links to remove"
+                log_message(message, silent_mode, log_file)
+            else:
+                mode_file_paths, removal_operations = file_paths, []
+
+            text_llm_provider = vision_llm_provider = None
             if mode == 'content':
                 # Proceed with content mode
                 # Initialize models once
@@ -259,77 +489,68 @@ def main():
                 
                 initialize_models(text_llm_provider, vision_llm_provider)
 
+                # Streaming mode links each file as soon as its metadata is ready, without a preview
+                streaming = get_yes_no("Would you like to organize files as they are processed, without a preview? (yes/no): ")
+
                 if not silent_mode:
                     print("*" * 50)
                     print("File paths collected successfully. Processing may take a few minutes.")
                     print("*" * 50)
 
-                # Prepare to collect link type statistics
-                link_type_counts = {'hardlink': 0, 'symlink': 0}
-
-                # Separate files by type
-                image_files, text_files = separate_files_by_type(file_paths)
-
-                # Create the text_llm_wrapper with the selected provider
-                text_llm_wrapper = get_text_llm_wrapper(text_llm_provider)
-
-                # Prepare text tuples for processing
-                text_tuples = []
-                for fp in text_files:
-                    # Use read_file_data to read the file content
-                    text_content = read_file_data(fp, text_llm_wrapper)
-                    if text_content is None:
-                        message = f"Unsupported or unreadable text file format: {fp}"
-                        if silent_mode:
-                            with open(log_file, 'a') as f:
-                                f.write(message + '\n')
-                        else:
-                            print(message)
-                        continue  # Skip unsupported or unreadable files
-                    text_tuples.append((fp, text_content))
-
-                # Process files sequentially
-                data_images = process_image_files(image_files, groq_client, vision_llm_provider, silent=silent_mode, log_file=log_file)
-
-                data_texts = process_text_files(text_tuples, text_llm_wrapper, silent=silent_mode, log_file=log_file)
-
-                # Prepare for copying and renaming
-                renamed_files = set()
-                processed_files = set()
-
-                # Combine all data
-                all_data = data_images + data_texts
-
-                # Compute the operations
-                operations = compute_operations(
-                    all_data,
+                if streaming:
+                    completed, failed = stream_content_mode(
+                        mode_file_paths,
+                        removal_operations,
+                        output_path,
+                        file_index,
+                        text_llm_provider,
+                        vision_llm_provider,
+                        silent=silent_mode,
+                        log_file=log_file
+                    )
+                    file_index.close()
+
+                    message = f"The files have been organized successfully ({completed} linked, {failed} failed)."
+                    if silent_mode:
+                        log_message(message, True, log_file)
+                    else:
+                        print("-" * 50)
+                        print(message)
+                        print("-" * 50)
+                    break  # Exit the sorting method loop after successful operation
+
+            # Plan the operations for the selected mode
+            clusters = {}
+            try:
+                operations, _ = plan_operations(
+                    mode,
+                    mode_file_paths,
+                    removal_operations,
                     output_path,
-                    renamed_files,
-                    processed_files,
-                    client  # Pass the client to compute_operations
+                    file_index,
+                    text_llm_provider=text_llm_provider,
+                    vision_llm_provider=vision_llm_provider,
+                    clusters=clusters,
+                    silent=silent_mode,
+                    log_file=log_file
                 )
-
-            elif mode == 'date':
-                # Process files by date
-                operations = process_files_by_date(file_paths, output_path, dry_run=False, silent=silent_mode, log_file=log_file)
-            elif mode == 'type':
-                # Process files by type
-                operations = process_files_by_type(file_paths, output_path, dry_run=False, silent=silent_mode, log_file=log_file)
-            else:
-                print("Invalid mode selected.")
-                return
+            except LinkStrategyError as e:
+                # A forced LFO_LINK_STRATEGY that cannot be used; nothing has been changed
+                log_message(str(e), silent_mode, log_file, level='error', error=str(e))
+                file_index.close()
+                continue
 
             # Simulate and display the proposed directory tree
             print("-" * 50)
             message = "Proposed directory structure:"
             if silent_mode:
-                with open(log_file, 'a') as f:
-                    f.write(message + '\n')
+                log_message(message, True, log_file)
             else:
                 print(message)
                 print(os.path.abspath(output_path))
                 simulated_tree = simulate_directory_tree(operations, output_path)
                 print_simulated_tree(simulated_tree)
+                print(summarize_link_types(operations))
                 print("-" * 50)
 
             # Ask user if they want to proceed
@@ -340,28 +561,30 @@ def main():
 
                 # Perform the actual file operations
                 message = "Performing file operations..."
-                if silent_mode:
-                    with open(log_file, 'a') as f:
-                        f.write(message + '\n')
-                else:
-                    print(message)
-                execute_operations(
+                log_message(message, silent_mode, log_file)
+                journal.start(mode, operations)
+                completed_operations = execute_operations(
                     operations,
                     dry_run=False,
                     silent=silent_mode,
-                    log_file=log_file
+                    log_file=log_file,
+                    journal=journal
                 )
+                file_index.record(completed_operations)
+                file_index.close()
+                journal.clear()
+                save_planned_clusters(output_path, clusters)
 
                 message = "The files have been organized successfully."
                 if silent_mode:
-                    with open(log_file, 'a') as f:
-                        f.write("-" * 50 + '\n' + message + '\n' + "-" * 50 + '\n')
+                    log_message(message, True, log_file)
                 else:
                     print("-" * 50)
                     print(message)
                     print("-" * 50)
                 break  # Exit the sorting method loop after successful operation
             else:
+                file_index.close()
                 # Ask if the user wants to try another sorting method
                 another_sort = get_yes_no("Would you like to choose another sorting method? (yes/no): ")
                 if another_sort:
@@ -375,6 +598,190 @@ def main():
         if not another_directory:
             break  # Exit the main loop
 
+def parse_args(argv=None):
+    """Parse command line arguments for non-interactive (batch) runs.
+
+    Defaults can be supplied in a JSON config file via --config, using the option names
+    as keys (e.g. {"mode": "type", "output": "/srv/organized", "concurrency": 8});
+    options given on the command line take precedence.
+    """
+    config_parser = argparse.ArgumentParser(add_help=False)
+    config_parser.add_argument('-c', '--config')
+    config_args, _ = config_parser.parse_known_args(argv)
+
+    parser = argparse.ArgumentParser(
+        description="Organize files by content, date or type. Runs interactively when no arguments are given.",
+        parents=[config_parser]
+    )
+    parser.add_argument('input', nargs='?', help="Directory (or file) to organize.")
+    parser.add_argument('-o', '--output', help="Output directory (default: 'organized_folder' next to the input).")
+    parser.add_argument('-m', '--mode', choices=['content', 'date', 'type'], help="How to organize the files.")
+    parser.add_argument('--text-llm', choices=['deepinfra', 'deepseek', 'local'], default='deepinfra', help="Text LLM provider for content mode ('local' needs LOCAL_MODEL_PATH).")
+    parser.add_argument('--vision-llm', choices=['groq', 'openai'], default='groq', help="Vision LLM provider for content mode.")
+    parser.add_argument('-j', '--concurrency', type=int, default=MAX_WORKERS, help="Number of files processed concurrently in content mode.")
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help="Number of short text documents packed into one LLM prompt.")
+    parser.add_argument('-y', '--yes', action='store_true', help="Apply the changes without asking for confirmation.")
+    parser.add_argument('-n', '--dry-run', action='store_true', help="Only show the planned operations.")
+    parser.add_argument('--stream', action='store_true', help="In content mode, link each file as soon as its metadata is ready (requires --yes). Every file is described on its own: near-duplicate images are not matched and identical files are only skipped with --dedup collapse.")
+    parser.add_argument('--link-strategy', choices=['auto', 'hardlink', 'reflink', 'symlink', 'copy'], default=LINK_STRATEGY, help="How files are placed in the output directory (default: the cheapest one that works).")
+    parser.add_argument('--resume', action='store_true', help="Finish the operations of an interrupted run instead of planning a new one.")
+    parser.add_argument('--full', action='store_true', help="Re-plan every file instead of only new or changed ones.")
+    parser.add_argument('--three-step', action='store_true', help="Use the three-step text metadata prompts instead of a single structured call.")
+    parser.add_argument('--cluster-categories', action='store_true', default=CLUSTER_CATEGORIES, help="Group files with similar descriptions into shared category folders (uses an embedding model).")
+    parser.add_argument('--dedup', choices=['link_all', 'collapse', 'off'], default=DEDUP_POLICY, help="Identical files: describe once and link every copy (link_all), link only one copy (collapse), or process each on its own (off).")
+    parser.add_argument('--include', action='append', default=[], metavar='PATTERN', help="Only organize files whose name or relative path matches this glob (repeatable).")
+    parser.add_argument('--exclude', action='append', default=[], metavar='PATTERN', help="Skip files and directories whose name or relative path matches this glob (repeatable).")
+    parser.add_argument('--max-depth', type=int, help="Only descend this many directory levels below the input (0 = the input directory only).")
+    parser.add_argument('--log-file', help="Write all output to this file instead of the terminal.")
+
+    if config_args.config:
+        with open(config_args.config) as f:
+            config = json.load(f)
+        parser.set_defaults(**{key.replace('-', '_'): value for key, value in config.items()})
+
+    args = parser.parse_args(argv)
+    if not args.input:
+        parser.error("the input path is required")
+    if not args.mode:
+        parser.error("--mode is required")
+    if args.stream and args.mode == 'content':
+        # The pipeline plans each file on its own, before the other descriptions are known
+        if args.cluster_categories:
+            parser.error("--cluster-categories cannot be combined with --stream")
+        if args.batch_size > 1:
+            parser.error("--batch-size above 1 cannot be combined with --stream")
+    return args
+
+def run_batch(args):
+    """Run a non-interactive organization pass. Returns the process exit status."""
+    silent = bool(args.log_file)
+    log_file = args.log_file
+    configure_run_log(log_file)
+
+    def log(message, level='info', **fields):
+        log_message(message, silent, log_file, level=level, **fields)
+
+    # The file index and journal record absolute paths, independent of the working directory
+    input_path = os.path.abspath(args.input)
+    if not os.path.exists(input_path):
+        log(f"Input path {input_path} does not exist.")
+        return 1
+    output_path = os.path.abspath(args.output or os.path.join(os.path.dirname(input_path), 'organized_folder'))
+    incremental = INCREMENTAL and not args.full
+    structured = STRUCTURED_METADATA and not args.three_step
+
+    set_link_strategy(args.link_strategy)
+    try:
+        journal = RunJournal(output_path)
+        if args.resume and not args.dry_run:
+            file_index = FileIndex(output_path, args.mode)
+            resumed = resume_run(journal, file_index, args.mode, silent=silent, log_file=log_file)
+            file_index.close()
+            if resumed is not None:
+                completed, failed = resumed
+                log(f"{completed} operations completed, {failed} failed.")
+                return 1 if failed else 0
+            log("No interrupted run to resume; starting a new one.")
+
+        streaming = args.mode == 'content' and args.stream and args.yes and not args.dry_run
+        if streaming and not incremental and args.dedup != 'collapse':
+            # Nothing to diff or collapse: the pipeline starts on the first files while the walk goes on
+            log("Organizing files while the input directory is walked")
+            file_index = FileIndex(output_path, args.mode)
+            completed, failed = stream_content_mode(
+                iter_file_paths(input_path, args.include, args.exclude, args.max_depth),
+                [],
+                output_path,
+                file_index,
+                args.text_llm,
+                args.vision_llm,
+                incremental=False,
+                max_workers=args.concurrency,
+                structured=structured,
+                silent=silent,
+                log_file=log_file
+            )
+            file_index.close()
+            log(f"{completed} operations completed, {failed} failed.")
+            return 1 if failed else 0
+
+        file_paths = collect_file_paths(input_path, args.include, args.exclude, args.max_depth)
+        if args.dedup == 'collapse':
+            file_paths = collapse_duplicates(file_paths, silent=silent, log_file=log_file)
+        file_index = FileIndex(output_path, args.mode)
+        if incremental:
+            filtered = bool(args.include or args.exclude) or args.max_depth is not None
+            file_paths, removal_operations = file_index.diff(file_paths, filtered=filtered)
+        else:
+            removal_operations = []
+        log(f"{len(file_paths)} files to organize, {len(removal_operations)} links to remove")
+        if args.yes and not args.dry_run:
+            # Created before planning so that link support is probed inside it
+            os.makedirs(output_path, exist_ok=True)
+
+        if streaming:
+            completed, failed = stream_content_mode(
+                file_paths,
+                removal_operations,
+                output_path,
+                file_index,
+                args.text_llm,
+                args.vision_llm,
+                incremental=incremental,
+                max_workers=args.concurrency,
+                structured=structured,
+                silent=silent,
+                log_file=log_file
+            )
+            file_index.close()
+            log(f"{completed} operations completed, {failed} failed.")
+            return 1 if failed else 0
+
+        clusters = {}
+        operations, failed_files = plan_operations(
+            args.mode,
+            file_paths,
+            removal_operations,
+            output_path,
+            file_index,
+            text_llm_provider=args.text_llm,
+            vision_llm_provider=args.vision_llm,
+            incremental=incremental,
+            max_workers=args.concurrency,
+            structured=structured,
+            batch_size=args.batch_size,
+            cluster_categories=args.cluster_categories,
+            dedup_policy=args.dedup,
+            clusters=clusters,
+            silent=silent,
+            log_file=log_file
+        )
+
+        log(summarize_link_types(operations))
+        if failed_files:
+            log(f"{failed_files} files could not be described and are left out.", level='warning')
+        if args.dry_run or not args.yes:
+            execute_operations(operations, dry_run=True, silent=silent, log_file=log_file)
+            if not args.dry_run:
+                log("No changes made. Pass --yes to apply them.")
+            file_index.close()
+            return 1 if failed_files else 0
+
+        journal.start(args.mode, operations)
+        completed_operations = execute_operations(operations, silent=silent, log_file=log_file, journal=journal)
+        file_index.record(completed_operations)
+        file_index.close()
+        journal.clear()
+        save_planned_clusters(output_path, clusters)
+        failed = len(operations) - len(completed_operations) + failed_files
+        log(f"{len(completed_operations)} operations completed, {failed} failed.")
+        return 1 if failed else 0
+    except Exception as e:
+        log(f"Error: {e}", level='error', error=str(e))
+        return 1
+
 
 if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        sys.exit(run_batch(parse_args()))
     main()
\ No newline at end of file
@@ -0,0 +1,85 @@
+import os
+import sqlite3
+import threading
+from file_utils import compute_file_hash
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'local_file_organizer')
+
+class MetadataCache:
+    """Persistent cache of LLM-derived metadata keyed on file content, model and prompt version."""
+
+    def __init__(self, db_path=None):
+        if db_path is None:
+            cache_dir = os.getenv('LFO_CACHE_DIR', DEFAULT_CACHE_DIR)
+            os.makedirs(cache_dir, exist_ok=True)
+            db_path = os.path.join(cache_dir, 'metadata_cache.sqlite')
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS metadata (
+                content_hash TEXT NOT NULL,
+                model TEXT NOT NULL,
+                prompt_version TEXT NOT NULL,
+                description TEXT,
+                foldername TEXT,
+                filename TEXT,
+                PRIMARY KEY (content_hash, model, prompt_version)
+            )"""
+        )
+        self._conn.commit()
+        # Content hashes computed during this run, keyed on (path, size, mtime_ns)
+        self._hashes = {}
+
+    def _content_hash(self, file_path):
+        """Return the content hash of a file, hashing each (path, size, mtime) only once per run."""
+        st = os.stat(file_path)
+        key = (file_path, st.st_size, st.st_mtime_ns)
+        content_hash = self._hashes.get(key)
+        if content_hash is None:
+            content_hash = compute_file_hash(file_path)
+            self._hashes[key] = content_hash
+        return content_hash
+
+    def get(self, file_path, model, prompt_version):
+        """Return cached metadata for a file, or None on a miss."""
+        try:
+            content_hash = self._content_hash(file_path)
+        except OSError:
+            return None
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT description, foldername, filename FROM metadata '
+                'WHERE content_hash = ? AND model = ? AND prompt_version = ?',
+                (content_hash, model, prompt_version)
+            ).fetchone()
+        if row is None:
+            return None
+        description, foldername, filename = row
+        return {
+            'file_path': file_path,
+            'foldername': foldername,
+            'filename': filename,
+            'description': description
+        }
+
+    def put(self, data, model, prompt_version):
+        """Store the metadata generated for data['file_path']."""
+        try:
+            content_hash = self._content_hash(data['file_path'])
+        except OSError:
+            return
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO metadata '
+                '(content_hash, model, prompt_version, description, foldername, filename) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (content_hash, model, prompt_version,
+                 data['description'], data['foldername'], data['filename'])
+            )
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,124 @@
+import os
+import sqlite3
+import functools
+from metadata_cache import DEFAULT_CACHE_DIR
+from run_log import log_message
+
+# OCR pages of PDFs that have no text layer (scanned documents)
+OCR_ENABLED = os.getenv("LFO_OCR", "1") != "0"
+# Also OCR images that look like documents (scans, screenshots of text) and describe
+# them from the text instead of sending them to the vision model
+OCR_IMAGES = os.getenv("LFO_OCR_IMAGES", "0") == "1"
+OCR_DPI = int(os.getenv("LFO_OCR_DPI", "200"))
+OCR_LANGUAGE = os.getenv("LFO_OCR_LANGUAGE", "eng")
+# A PDF page with less text than this is treated as having no text layer
+OCR_MIN_PAGE_CHARS = 20
+# A document-like image needs at least this much recognized text to skip the vision model
+OCR_MIN_IMAGE_CHARS = int(os.getenv("LFO_OCR_MIN_IMAGE_CHARS", "200"))
+OCR_MAX_IMAGE_EDGE = 3000
+
+@functools.lru_cache(maxsize=None)
+def ocr_available():
+    """Return True if pytesseract and the tesseract binary can be used (checked once per process)."""
+    try:
+        import pytesseract
+        pytesseract.get_tesseract_version()
+        return True
+    except Exception as e:
+        log_message(f"OCR disabled: {e}", level='warning', stage='extract', error=str(e))
+        return False
+
+class OCRCache:
+    """Recognized text keyed on file content hash, page, DPI and language.
+
+    Shares the cache directory of MetadataCache. Opened per process, as OCR runs in the
+    extraction worker processes.
+    """
+
+    def __init__(self, db_path=None):
+        if db_path is None:
+            cache_dir = os.getenv('LFO_CACHE_DIR', DEFAULT_CACHE_DIR)
+            os.makedirs(cache_dir, exist_ok=True)
+            db_path = os.path.join(cache_dir, 'ocr_cache.sqlite')
+        self._conn = sqlite3.connect(db_path, timeout=30)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS ocr (
+                content_hash TEXT NOT NULL,
+                page INTEGER NOT NULL,
+                dpi INTEGER NOT NULL,
+                language TEXT NOT NULL,
+                text TEXT,
+                PRIMARY KEY (content_hash, page, dpi, language)
+            )"""
+        )
+        self._conn.commit()
+
+    def get(self, content_hash, page, dpi, language=OCR_LANGUAGE):
+        row = self._conn.execute(
+            'SELECT text FROM ocr WHERE content_hash = ? AND page = ? AND dpi = ? AND language = ?',
+            (content_hash, page, dpi, language)
+        ).fetchone()
+        return None if row is None else row[0]
+
+    def put(self, content_hash, page, dpi, text, language=OCR_LANGUAGE):
+        self._conn.execute('INSERT OR REPLACE INTO ocr VALUES (?, ?, ?, ?, ?)',
+                           (content_hash, page, dpi, language, text))
+        self._conn.commit()
+
+@functools.lru_cache(maxsize=None)
+def get_ocr_cache():
+    """Return this process's OCR cache."""
+    return OCRCache()
+
+def ocr_image(image, language=OCR_LANGUAGE):
+    """Recognize the text in a PIL image."""
+    import pytesseract
+    return pytesseract.image_to_string(image, lang=language).strip()
+
+def ocr_pdf_page(page, dpi=OCR_DPI, language=OCR_LANGUAGE):
+    """Rasterize a PyMuPDF page in grayscale at `dpi` and recognize its text."""
+    import fitz
+    from PIL import Image
+    pix = page.get_pixmap(dpi=dpi, colorspace=fitz.csGRAY, alpha=False)
+    image = Image.frombytes('L', (pix.width, pix.height), pix.samples)
+    return ocr_image(image, language)
+
+def cached_ocr(content_hash, page, dpi, recognize):
+    """Return the cached text for a page, or run recognize() and cache its result."""
+    cache = get_ocr_cache()
+    text = cache.get(content_hash, page, dpi)
+    if text is None:
+        text = recognize()
+        cache.put(content_hash, page, dpi, text)
+    return text
+
+def looks_like_document(image):
+    """Cheap check for scans and screenshots of text: a mostly light (paper), low-saturation
+    image with some darker (ink) pixels. Thin text turns gray when downscaled, so ink is
+    anything that is not light."""
+    small = image.convert('RGB')
+    small.thumbnail((256, 256))
+    gray = small.convert('L').histogram()
+    pixels = sum(gray)
+    light = sum(gray[200:]) / pixels
+    saturation = small.convert('HSV').getchannel('S').histogram()
+    mean_saturation = sum(value * count for value, count in enumerate(saturation)) / pixels
+    return 0.5 < light < 0.99 and mean_saturation < 40
+
+def extract_document_image_text(image_path, content_hash=None):
+    """Return the OCR text of a document-like image, or None if it does not look like a
+    document or too little text is recognized."""
+    if not ocr_available():
+        return None
+    from PIL import Image, ImageOps
+    with Image.open(image_path) as img:
+        if not looks_like_document(img):
+            return None
+        image = ImageOps.exif_transpose(img).convert('L')
+    image.thumbnail((OCR_MAX_IMAGE_EDGE, OCR_MAX_IMAGE_EDGE))
+    if content_hash is None:
+        from file_utils import compute_file_hash
+        content_hash = compute_file_hash(image_path)
+    text = cached_ocr(content_hash, 0, 0, lambda: ocr_image(image))
+    return text if len(text) >= OCR_MIN_IMAGE_CHARS else None
@@ -0,0 +1,171 @@
+import os
+import queue
+import threading
+from rich.progress import Progress, TextColumn, BarColumn, TimeElapsedColumn
+from file_utils import read_file_data, IMAGE_EXTENSIONS, TEXT_EXTENSIONS, CODE_EXTENSIONS
+from data_processing_common import compute_operations, execute_operation, DestinationNamer
+from text_data_processing import process_single_text_file, TEXT_PROMPT_VERSION
+from image_data_processing import process_single_image, prepare_image_payload, IMAGE_PROMPT_VERSION
+from llm_utils import get_vision_llm
+from extraction_pool import ExtractionPool
+from run_log import log_message
+
+_DONE = object()
+
+def _start_stage(func, inbox, outbox, workers, failures, silent=False, log_file=None):
+    """Run func over items from inbox on `workers` threads, putting its outputs on outbox.
+
+    func returns an iterable of output items. Items on which func raises are logged and
+    appended to the failures list. When the end-of-stream marker arrives on inbox and
+    every worker has finished, the marker is forwarded to outbox.
+    """
+    remaining = [workers]
+    lock = threading.Lock()
+
+    def worker():
+        while True:
+            item = inbox.get()
+            if item is _DONE:
+                inbox.put(_DONE)  # Let the other workers of this stage see it too
+                with lock:
+                    remaining[0] -= 1
+                    last = remaining[0] == 0
+                if last:
+                    outbox.put(_DONE)
+                return
+            try:
+                for output in func(item):
+                    outbox.put(output)
+            except Exception as e:
+                if isinstance(item, tuple):
+                    path = item[1]
+                elif isinstance(item, dict):
+                    path = item.get('file_path')
+                else:
+                    path = item
+                failures.append(path)
+                log_message(f"Error processing {path}: {e}", silent, log_file, level='error', path=path, stage=func.__name__, error=str(e))
+
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(workers)]
+    for thread in threads:
+        thread.start()
+    return threads
+
+def run_content_pipeline(file_paths, output_path, vision_llm_provider, text_inference, text_model,
+                         cache=None, file_index=None, renamed_files=None, max_workers=1, structured=True,
+                         queue_size=64, silent=False, log_file=None):
+    """Organize files by content as a streaming pipeline.
+
+    Stages are walk -> classify -> extract -> infer -> plan -> link, connected by bounded
+    queues so a slow stage applies backpressure to the ones before it. Each link is created
+    (and recorded in file_index) as soon as its metadata is ready, so memory stays flat and
+    an interrupted run keeps everything linked so far. file_paths may be any iterable,
+    including a generator that is still walking the input directory.
+
+    Returns a (completed, failed) tuple: the number of links created, and the number of
+    links that failed plus files on which an earlier stage raised (e.g. the LLM request
+    failed).
+    """
+    vision_model = get_vision_llm(vision_llm_provider)
+    renamed_files = DestinationNamer() if renamed_files is None else renamed_files
+    processed_files = set()
+
+    classify_queue = queue.Queue(maxsize=queue_size)
+    extract_queue = queue.Queue(maxsize=queue_size)
+    infer_queue = queue.Queue(maxsize=queue_size)
+    plan_queue = queue.Queue(maxsize=queue_size)
+    link_queue = queue.Queue(maxsize=queue_size)
+
+    def walk():
+        try:
+            for file_path in file_paths:
+                classify_queue.put(file_path)
+        finally:
+            classify_queue.put(_DONE)
+
+    def classify(file_path):
+        ext = os.path.splitext(file_path.lower())[1]
+        if ext in IMAGE_EXTENSIONS:
+            yield ('image', file_path)
+        elif ext in TEXT_EXTENSIONS or ext in CODE_EXTENSIONS:
+            yield ('text', file_path)
+
+    def extract(item):
+        kind, file_path = item
+        model, prompt_version = (vision_model, IMAGE_PROMPT_VERSION) if kind == 'image' else (text_model, TEXT_PROMPT_VERSION)
+        data = cache.get(file_path, model, prompt_version) if cache else None
+        if data is not None:
+            yield ('cached', file_path, data)
+        elif kind == 'image':
+            yield ('image', file_path, extraction_pool.submit(prepare_image_payload, file_path).result())
+        else:
+            content = extraction_pool.submit(read_file_data, file_path).result()
+            if content is None:
+                log_message(f"Unsupported or unreadable text file format: {file_path}", silent, log_file, level='warning',
+                            path=file_path, stage='extract', error='unreadable')
+                return
+            yield ('text', file_path, content)
+
+    def infer(item):
+        kind, file_path, payload = item
+        if kind == 'cached':
+            log_message(f"Cached metadata: {file_path}", silent, log_file, level='debug', path=file_path, stage='describe', cache_hit=True)
+            yield payload
+        elif kind == 'image':
+            data = process_single_image(file_path, vision_llm_provider, silent=silent, log_file=log_file,
+                                        text_inference=text_inference, image_payload=payload, progress=progress)
+            if cache:
+                cache.put(data, vision_model, IMAGE_PROMPT_VERSION)
+            yield data
+        else:
+            data = process_single_text_file((file_path, payload), text_inference, silent=silent, log_file=log_file,
+                                            progress=progress, structured=structured)
+            if cache:
+                cache.put(data, text_model, TEXT_PROMPT_VERSION)
+            yield data
+
+    def plan(data):
+        # A single planner thread owns renamed_files, so collision handling stays consistent
+        return compute_operations([data], output_path, renamed_files, processed_files, None)
+
+    completed = failed = 0
+    failures = []  # Files dropped by an exception in classify, extract, infer or plan
+    with ExtractionPool() as extraction_pool, Progress(
+        TextColumn("[progress.description]{task.description}"),
+        BarColumn(),
+        TimeElapsedColumn()
+    ) as progress:
+        threading.Thread(target=walk, daemon=True).start()
+        _start_stage(classify, classify_queue, extract_queue, 1, failures, silent, log_file)
+        # One extract thread per worker process keeps every process busy
+        _start_stage(extract, extract_queue, infer_queue, extraction_pool.max_workers, failures, silent, log_file)
+        _start_stage(infer, infer_queue, plan_queue, max_workers, failures, silent, log_file)
+        _start_stage(plan, plan_queue, link_queue, 1, failures, silent, log_file)
+
+        # Link stage runs on the calling thread, which also owns the file index connection
+        batch = []
+        created_dirs = set()
+        while True:
+            operation = link_queue.get()
+            if operation is _DONE:
+                break
+            dir_path = os.path.dirname(operation['destination'])
+            if dir_path not in created_dirs:
+                os.makedirs(dir_path, exist_ok=True)
+                created_dirs.add(dir_path)
+            success, message, transfer = execute_operation(operation, make_dirs=False)
+            log_message(message, silent, log_file, level='info' if success else 'error', path=operation['source'],
+                        stage='link', destination=operation['destination'], link_type=operation['link_type'],
+                        bytes=transfer[1] if transfer else None, error=None if success else message)
+            if success:
+                completed += 1
+                batch.append(operation)
+            else:
+                failed += 1
+            if file_index is not None and len(batch) >= 100:
+                file_index.record(batch)
+                batch = []
+        if file_index is not None and batch:
+            file_index.record(batch)
+
+    return completed, failed + len(failures)
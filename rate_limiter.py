@@ -0,0 +1,74 @@
+import time
+import random
+import threading
+
+class TokenBucket:
+    """Thread-safe token bucket allowing `rate` requests per `per` seconds with bursts up to `capacity`."""
+
+    def __init__(self, rate, per=60.0, capacity=None):
+        self.fill_rate = rate / per
+        self.capacity = capacity if capacity is not None else max(1, rate)
+        self.tokens = float(self.capacity)
+        self.last_refill = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.fill_rate)
+        self.last_refill = now
+
+    def acquire(self, tokens=1):
+        """Block until `tokens` tokens are available, then consume them."""
+        while True:
+            with self._lock:
+                self._refill()
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                wait_time = (tokens - self.tokens) / self.fill_rate
+            time.sleep(wait_time)
+
+def is_rate_limit_error(error):
+    """Return True if the exception looks like an HTTP 429 / rate limit response."""
+    status = getattr(error, 'status_code', None)
+    if status is None:
+        status = getattr(getattr(error, 'response', None), 'status_code', None)
+    if status == 429:
+        return True
+    message = str(error).lower()
+    return '429' in message or 'rate limit' in message or 'rate_limit' in message
+
+# Exception classes (by name, so the SDK is not imported here) for requests that never got an answer
+TRANSIENT_ERROR_NAMES = ('APIConnectionError', 'APITimeoutError', 'TimeoutException', 'NetworkError')
+
+def is_transient_error(error):
+    """Return True for server errors (HTTP 5xx), timeouts and dropped connections."""
+    status = getattr(error, 'status_code', None)
+    if status is None:
+        status = getattr(getattr(error, 'response', None), 'status_code', None)
+    if isinstance(status, int) and status >= 500:
+        return True
+    return any(cls.__name__ in TRANSIENT_ERROR_NAMES for cls in type(error).__mro__)
+
+def retry_with_backoff(func, limiter=None, max_retries=5, max_transient_retries=3, base_delay=1.0, max_delay=60.0):
+    """Call func(), retrying with exponential backoff and jitter on rate limit and transient errors.
+
+    Rate limits are retried up to max_retries times; server errors, timeouts and connection
+    failures, which are less likely to clear up by waiting, up to max_transient_retries times.
+    """
+    for attempt in range(max_retries + 1):
+        if limiter is not None:
+            limiter.acquire()
+        try:
+            return func()
+        except Exception as e:
+            if is_rate_limit_error(e):
+                retries = max_retries
+            elif is_transient_error(e):
+                retries = max_transient_retries
+            else:
+                raise
+            if attempt >= retries:
+                raise
+            delay = min(max_delay, base_delay * (2 ** attempt))
+            time.sleep(delay + random.uniform(0, delay / 2))
@@ -0,0 +1,131 @@
+import os
+import json
+import time
+import queue
+import atexit
+import threading
+import multiprocessing
+
+# Lowest level that is logged: debug, info, warning or error
+LOG_LEVEL = os.getenv("LFO_LOG_LEVEL", "info").lower()
+LEVELS = {'debug': 10, 'info': 20, 'warning': 30, 'error': 40}
+# Seconds between flushes of the log file while messages keep arriving
+LOG_FLUSH_INTERVAL = 1.0
+LOG_BUFFER_BYTES = 1 << 20
+# Log file used when log_message is not told otherwise; set with configure_run_log, and
+# passed on to extraction worker processes through the environment
+LOG_FILE = os.getenv("LFO_LOG_FILE") or None
+_encoder = json.JSONEncoder(ensure_ascii=False, default=str)
+
+class RunLog:
+    """A JSON-lines log file written by a background thread.
+
+    Callers only enqueue records; one thread keeps the file open and writes through a
+    large buffer that is flushed every LOG_FLUSH_INTERVAL seconds and at exit, instead of
+    opening and closing the file for every message.
+    """
+
+    def __init__(self, path, flush_interval=LOG_FLUSH_INTERVAL):
+        self.path = path
+        self.flush_interval = flush_interval
+        self._queue = queue.SimpleQueue()
+        # Opened here so that a bad path fails in the caller, not in the writer thread
+        self._file = open(path, 'a', buffering=LOG_BUFFER_BYTES, encoding='utf-8')
+        self._thread = threading.Thread(target=self._write_records, name='run-log', daemon=True)
+        self._thread.start()
+
+    def write(self, record):
+        self._queue.put(record)
+
+    def _write_records(self):
+        with self._file as f:
+            last_flush = time.monotonic()
+            while True:
+                try:
+                    record = self._queue.get(timeout=self.flush_interval)
+                except queue.Empty:
+                    f.flush()
+                    last_flush = time.monotonic()
+                    continue
+                if record is None:
+                    return
+                f.write(_encoder.encode(record) + '\n')
+                if time.monotonic() - last_flush >= self.flush_interval:
+                    f.flush()
+                    last_flush = time.monotonic()
+
+    def close(self):
+        """Write out every queued record and stop the writer thread."""
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+
+_run_logs = {}
+_run_logs_lock = threading.Lock()
+
+def get_run_log(log_file):
+    """Return the RunLog of log_file, shared by every module and thread of the process."""
+    run_log = _run_logs.get(log_file)
+    if run_log is not None:
+        return run_log
+    with _run_logs_lock:
+        run_log = _run_logs.get(log_file)
+        if run_log is None:
+            run_log = _run_logs[log_file] = RunLog(log_file)
+        return run_log
+
+@atexit.register
+def close_run_logs():
+    with _run_logs_lock:
+        for run_log in _run_logs.values():
+            run_log.close()
+        _run_logs.clear()
+
+def configure_run_log(log_file):
+    """Make log_file (or the terminal, if None) the default destination of log_message.
+
+    Helpers that are not given silent/log_file, such as the LLM client and the document
+    readers in the extraction worker processes, log there.
+    """
+    global LOG_FILE
+    LOG_FILE = log_file or None
+    if LOG_FILE:
+        os.environ["LFO_LOG_FILE"] = LOG_FILE
+    else:
+        os.environ.pop("LFO_LOG_FILE", None)
+
+def _append_record(log_file, record):
+    with open(log_file, 'a', encoding='utf-8') as f:
+        f.write(_encoder.encode(record) + '\n')
+
+def log_message(message, silent=None, log_file=None, level='info', **fields):
+    """Print message, or in silent mode append it to log_file as a JSON record.
+
+    Per-file records carry keyword fields such as path, stage ('extract', 'describe',
+    'link'), duration (seconds), bytes, tokens (estimated prompt tokens), cache_hit and
+    error; fields that are None are left out. Without silent, the default set by
+    configure_run_log is used.
+    """
+    if LEVELS.get(level, 20) < LEVELS.get(LOG_LEVEL, 20):
+        return
+    if silent is None:
+        silent, log_file = bool(LOG_FILE), LOG_FILE
+    if silent:
+        if log_file:
+            record = {'time': round(time.time(), 3), 'level': level, 'message': message}
+            record.update((key, value) for key, value in fields.items() if value is not None)
+            if multiprocessing.parent_process() is not None:
+                # Worker processes exit without running atexit handlers, which would lose
+                # buffered records; their few messages are appended directly
+                _append_record(log_file, record)
+            else:
+                get_run_log(log_file).write(record)
+    else:
+        print(message)
+
+def file_size(path):
+    """Return the size of path in bytes, or None if it cannot be read."""
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return None
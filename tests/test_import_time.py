@@ -0,0 +1,38 @@
+import os
+import sys
+import json
+import unittest
+import subprocess
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Seconds 'import main' may take; date and type modes must start well under a second
+IMPORT_BUDGET = float(os.getenv("LFO_IMPORT_BUDGET", "0.5"))
+# Imported only by the readers and providers that need them
+HEAVY_MODULES = ('groq', 'openai', 'litellm', 'pandas', 'fitz', 'docx', 'pptx', 'PIL', 'numpy', 'httpx')
+
+PROBE = """
+import sys, json, time
+start = time.perf_counter()
+import main
+elapsed = time.perf_counter() - start
+print(json.dumps({'elapsed': elapsed, 'modules': sorted(sys.modules)}))
+"""
+
+class ImportTimeTest(unittest.TestCase):
+    def setUp(self):
+        # A fresh interpreter, so nothing imported by the test runner is counted
+        result = subprocess.run([sys.executable, '-c', PROBE], cwd=REPO_ROOT, capture_output=True,
+                                text=True, timeout=60)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.report = json.loads(result.stdout.strip().splitlines()[-1])
+
+    def test_no_heavy_modules(self):
+        loaded = [name for name in HEAVY_MODULES if name in self.report['modules']]
+        self.assertEqual(loaded, [], f"'import main' loaded {', '.join(loaded)}")
+
+    def test_import_budget(self):
+        self.assertLess(self.report['elapsed'], IMPORT_BUDGET,
+                        f"'import main' took {self.report['elapsed']:.2f}s (budget {IMPORT_BUDGET}s)")
+
+if __name__ == '__main__':
+    unittest.main()
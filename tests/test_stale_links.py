@@ -0,0 +1,157 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from file_index import FileIndex
+from journal import RunJournal
+from data_processing_common import execute_operations
+from main import resume_run
+
+MODE = 'content'
+
+class StaleLinkTest(unittest.TestCase):
+    """Which links in the output directory an incremental run removes, and which it leaves alone."""
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.input_path = os.path.join(self.root, 'input')
+        self.output_path = os.path.join(self.root, 'output')
+        os.makedirs(self.input_path)
+        os.makedirs(self.output_path)
+        self.sources = {name: self.write_source(name, f"{name} contents") for name in ('a.txt', 'b.txt', 'c.txt')}
+        self.destinations = {name: os.path.join(self.output_path, 'docs', name) for name in self.sources}
+        index = FileIndex(self.output_path, MODE)
+        index.record(self.execute([self.link_operation(name) for name in self.sources]))
+        index.close()
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def write_source(self, name, text):
+        path = os.path.join(self.input_path, name)
+        # Write a new file and move it into place, as editors do, so the source gets a new inode
+        with open(path + '.tmp', 'w') as f:
+            f.write(text)
+        os.replace(path + '.tmp', path)
+        return path
+
+    def link_operation(self, name):
+        return {'source': self.sources[name], 'destination': self.destinations[name], 'link_type': 'hardlink'}
+
+    def execute(self, operations, journal=None):
+        return execute_operations(operations, silent=True, journal=journal)
+
+    def diff(self, file_paths, filtered=False):
+        index = FileIndex(self.output_path, MODE)
+        try:
+            return index.diff(file_paths, filtered=filtered)
+        finally:
+            index.close()
+
+    def read(self, path):
+        with open(path) as f:
+            return f.read()
+
+    def test_unchanged_sources_are_kept(self):
+        changed, removals = self.diff(list(self.sources.values()))
+        self.assertEqual(changed, [])
+        self.assertEqual(removals, [])
+
+    def test_changed_source_replaces_its_link(self):
+        self.write_source('a.txt', "new contents")
+        changed, removals = self.diff(list(self.sources.values()))
+        self.assertEqual(changed, [self.sources['a.txt']])
+        self.assertEqual([op['destination'] for op in removals], [self.destinations['a.txt']])
+
+        self.execute(removals)
+        self.assertFalse(os.path.lexists(self.destinations['a.txt']))
+        self.assertTrue(os.path.exists(self.destinations['b.txt']))
+        self.assertTrue(os.path.exists(self.destinations['c.txt']))
+
+    def test_touched_but_unchanged_source_is_kept(self):
+        os.utime(self.sources['a.txt'], ns=(0, 0))
+        changed, removals = self.diff(list(self.sources.values()))
+        self.assertEqual(changed, [])
+        self.assertEqual(removals, [])
+
+    def test_deleted_source_removes_its_link(self):
+        os.remove(self.sources['b.txt'])
+        changed, removals = self.diff([self.sources['a.txt'], self.sources['c.txt']])
+        self.assertEqual(changed, [])
+        self.assertEqual([op['destination'] for op in removals], [self.destinations['b.txt']])
+
+        self.execute(removals)
+        self.assertFalse(os.path.lexists(self.destinations['b.txt']))
+        self.assertEqual(self.read(self.destinations['a.txt']), "a.txt contents")
+
+    def test_filtered_out_source_keeps_its_link(self):
+        # c.txt still exists but was excluded by --include/--exclude/--max-depth
+        changed, removals = self.diff([self.sources['a.txt'], self.sources['b.txt']], filtered=True)
+        self.assertEqual(changed, [])
+        self.assertEqual(removals, [])
+
+        # Once it is deleted, its link goes even in a filtered run
+        os.remove(self.sources['c.txt'])
+        _, removals = self.diff([self.sources['a.txt'], self.sources['b.txt']], filtered=True)
+        self.assertEqual([op['destination'] for op in removals], [self.destinations['c.txt']])
+
+    def test_unfiltered_run_removes_links_of_missing_sources(self):
+        _, removals = self.diff([self.sources['a.txt'], self.sources['b.txt']])
+        self.assertEqual([op['destination'] for op in removals], [self.destinations['c.txt']])
+
+    def test_destination_replaced_by_user_is_left_alone(self):
+        destination = self.destinations['b.txt']
+        os.remove(destination)
+        with open(destination, 'w') as f:
+            f.write("the user's own file")
+        os.remove(self.sources['b.txt'])
+
+        _, removals = self.diff([self.sources['a.txt'], self.sources['c.txt']])
+        self.assertEqual([op['destination'] for op in removals], [destination])
+        completed = self.execute(removals)
+        self.assertEqual(len(completed), 1)
+        self.assertEqual(self.read(destination), "the user's own file")
+
+    def test_missing_destination_is_relinked(self):
+        os.remove(self.destinations['a.txt'])
+        changed, removals = self.diff(list(self.sources.values()))
+        self.assertEqual(changed, [self.sources['a.txt']])
+        self.assertEqual(removals, [])
+
+    def test_resume_finishes_an_interrupted_run(self):
+        self.sources['d.txt'] = self.write_source('d.txt', "d.txt contents")
+        self.sources['e.txt'] = self.write_source('e.txt', "e.txt contents")
+        os.remove(self.sources['a.txt'])
+        for name in ('d.txt', 'e.txt'):
+            self.destinations[name] = os.path.join(self.output_path, 'docs', name)
+        changed, removals = self.diff(list(self.sources.values())[1:])
+        self.assertEqual(changed, [self.sources['d.txt'], self.sources['e.txt']])
+        operations = removals + [self.link_operation('d.txt'), self.link_operation('e.txt')]
+
+        # The run is interrupted after the removal and the first link
+        journal = RunJournal(self.output_path)
+        journal.start(MODE, operations)
+        self.execute(operations[:2], journal=journal)
+        journal.close()
+        self.assertFalse(os.path.lexists(self.destinations['a.txt']))
+        self.assertFalse(os.path.lexists(self.destinations['e.txt']))
+
+        journal = RunJournal(self.output_path)
+        index = FileIndex(self.output_path, MODE)
+        self.assertEqual(resume_run(journal, index, MODE, silent=True), (3, 0))
+        index.close()
+        self.assertEqual(self.read(self.destinations['e.txt']), "e.txt contents")
+        self.assertIsNone(RunJournal(self.output_path).unfinished(MODE))
+
+        # The index now matches the output: nothing left to do, and a.txt is forgotten
+        changed, removals = self.diff(list(self.sources.values())[1:])
+        self.assertEqual(changed, [])
+        self.assertEqual(removals, [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,36 +1,55 @@
 import re
 import os
 import time
+from concurrent.futures import ThreadPoolExecutor
 from rich.progress import Progress, TextColumn, BarColumn, TimeElapsedColumn
 from data_processing_common import sanitize_filename
+from llm_utils import parse_json_response, parse_json_array_response
+from file_utils import EXTRACT_CHAR_BUDGET
+from run_log import log_message, file_size
+
+# Bump whenever the metadata prompts change so cached results are regenerated
+TEXT_PROMPT_VERSION = '2'
+
+# Documents up to this many characters may be packed together into one batched prompt
+SHORT_DOCUMENT_CHARS = 1000
+# Approximate token budget of one batched prompt, including the expected answer
+BATCH_TOKEN_BUDGET = 4000
+PROMPT_OVERHEAD_TOKENS = 250
+OUTPUT_TOKENS_PER_DOCUMENT = 160
 
 def summarize_text_content(input_text, text_inference):
-    prompt = f"Summarize the following text in 100 words or less:\n\n{input_text[:2000]}"
+    prompt = f"Summarize the following text in 100 words or less:\n\n{input_text[:EXTRACT_CHAR_BUDGET]}"
     return text_inference(prompt)
 
-def process_single_text_file(args, text_inference, silent=False, log_file=None):
-    """Process a single text file to generate metadata."""
+def process_single_text_file(args, text_inference, silent=False, log_file=None, progress=None, structured=True):
+    """Process a single text file to generate metadata.
+
+    If `progress` is given, a task is added to that shared progress display instead of
+    opening a new one, which allows several files to be processed concurrently.
+    """
     file_path, text = args
     start_time = time.time()
 
-    with Progress(
-        TextColumn("[progress.description]{task.description}"),
-        BarColumn(),
-        TimeElapsedColumn()
-    ) as progress:
+    if progress is not None:
         task_id = progress.add_task(f"Processing {os.path.basename(file_path)}", total=1.0)
-        foldername, filename, description = generate_text_metadata(text, file_path, progress, task_id, text_inference)
+        foldername, filename, description = generate_text_metadata(text, file_path, progress, task_id, text_inference, structured=structured)
+    else:
+        with Progress(
+            TextColumn("[progress.description]{task.description}"),
+            BarColumn(),
+            TimeElapsedColumn()
+        ) as progress:
+            task_id = progress.add_task(f"Processing {os.path.basename(file_path)}", total=1.0)
+            foldername, filename, description = generate_text_metadata(text, file_path, progress, task_id, text_inference, structured=structured)
 
     end_time = time.time()
     time_taken = end_time - start_time
 
     message = f"File: {file_path}\nTime taken: {time_taken:.2f} seconds\nDescription: {description}\nFolder name: {foldername}\nGenerated filename: {filename}\n"
-    if silent:
-        if log_file:
-            with open(log_file, 'a') as f:
-                f.write(message + '\n')
-    else:
-        print(message)
+    log_message(message, silent, log_file, path=file_path, stage='describe', duration=round(time_taken, 3),
+                bytes=file_size(file_path), tokens=estimate_tokens(text[:EXTRACT_CHAR_BUDGET]), cache_hit=False,
+                folder=foldername, filename=filename)
     return {
         'file_path': file_path,
         'foldername': foldername,
@@ -38,20 +57,240 @@ def process_single_text_file(args, text_inference, silent=False, log_file=None):
         'description': description
     }
 
-def process_text_files(text_tuples, text_inference, silent=False, log_file=None):
-    """Process text files sequentially."""
-    results = []
-    for args in text_tuples:
-        data = process_single_text_file(args, text_inference, silent=silent, log_file=log_file)
-        results.append(data)
+def estimate_tokens(text):
+    """Rough token count of a text (about four characters per token)."""
+    return len(text) // 4 + 1
+
+def make_batches(text_tuples, batch_size, token_budget=BATCH_TOKEN_BUDGET):
+    """Greedily pack text tuples into batches of at most batch_size documents within token_budget.
+
+    Returns lists of indices into text_tuples.
+    """
+    batches = []
+    current, current_tokens = [], PROMPT_OVERHEAD_TOKENS
+    for index, (_, text) in enumerate(text_tuples):
+        cost = estimate_tokens(text[:SHORT_DOCUMENT_CHARS]) + OUTPUT_TOKENS_PER_DOCUMENT
+        if current and (len(current) >= batch_size or current_tokens + cost > token_budget):
+            batches.append(current)
+            current, current_tokens = [], PROMPT_OVERHEAD_TOKENS
+        current.append(index)
+        current_tokens += cost
+    if current:
+        batches.append(current)
+    return batches
+
+def process_text_batch(text_tuples, text_inference, silent=False, log_file=None, progress=None, structured=True):
+    """Process several short text files with shared multi-document prompts.
+
+    Documents the batched prompts fail to cover are processed individually; a document
+    whose individual processing fails as well is logged and left out of the result.
+    """
+    start_time = time.time()
+
+    def generate(progress):
+        task_id = progress.add_task(f"Processing batch of {len(text_tuples)} files", total=1.0)
+        try:
+            results = generate_batch_text_metadata([text for _, text in text_tuples], text_inference)
+        except Exception as e:
+            # Every document falls back to its own request below
+            log_message(f"Batched request failed: {str(e)}", silent, log_file, level='warning', stage='describe', error=str(e))
+            results = [None] * len(text_tuples)
+        for k, (file_path, text) in enumerate(text_tuples):
+            if results[k] is None:
+                sub_task = progress.add_task(f"Processing {os.path.basename(file_path)}", total=1.0)
+                try:
+                    results[k] = generate_text_metadata(text, file_path, progress, sub_task, text_inference, structured=structured)
+                except Exception as e:
+                    message = f"Error processing text file {file_path}: {str(e)}"
+                    log_message(message, silent, log_file, level='error', path=file_path, stage='describe', error=str(e))
+        progress.update(task_id, completed=1.0)
+        return results
+
+    if progress is not None:
+        results = generate(progress)
+    else:
+        with Progress(
+            TextColumn("[progress.description]{task.description}"),
+            BarColumn(),
+            TimeElapsedColumn()
+        ) as progress:
+            results = generate(progress)
+
+    time_taken = time.time() - start_time
+    data_list = []
+    for (file_path, text), result in zip(text_tuples, results):
+        if result is None:
+            continue
+        foldername, filename, description = result
+        message = f"File: {file_path}\nTime taken: {time_taken:.2f} seconds (batch of {len(text_tuples)})\nDescription: {description}\nFolder name: {foldername}\nGenerated filename: {filename}\n"
+        log_message(message, silent, log_file, path=file_path, stage='describe', duration=round(time_taken, 3),
+                    bytes=file_size(file_path), tokens=estimate_tokens(text[:SHORT_DOCUMENT_CHARS]), cache_hit=False,
+                    folder=foldername, filename=filename, batch_size=len(text_tuples))
+        data_list.append({
+            'file_path': file_path,
+            'foldername': foldername,
+            'filename': filename,
+            'description': description
+        })
+    return data_list
+
+def process_text_files(text_tuples, text_inference, silent=False, log_file=None, cache=None, model=None, max_workers=1, structured=True,
+                       batch_size=1, token_budget=BATCH_TOKEN_BUDGET):
+    """Process text files, reusing cached metadata for unchanged files.
+
+    With batch_size > 1, documents of up to SHORT_DOCUMENT_CHARS characters are packed
+    into multi-document prompts of at most batch_size documents and token_budget tokens.
+    With max_workers > 1 the work is done by a bounded thread pool. Results are always
+    returned in the same order as text_tuples; files whose processing fails are logged and
+    left out, like in process_image_files.
+    """
+    results = [None] * len(text_tuples)
+    pending = []
+    for index, args in enumerate(text_tuples):
+        data = cache.get(args[0], model, TEXT_PROMPT_VERSION) if cache else None
+        if data is not None:
+            results[index] = data
+            log_message(f"Cached metadata: {args[0]}", silent, log_file, level='debug', path=args[0], stage='describe', cache_hit=True)
+        else:
+            pending.append(index)
+
+    # Each unit of work is a list of indices: a single document or a batch of short ones
+    if batch_size > 1:
+        short = [i for i in pending if len(text_tuples[i][1]) <= SHORT_DOCUMENT_CHARS]
+        short_set = set(short)
+        units = [[i] for i in pending if i not in short_set]
+        units += [[short[k] for k in batch] for batch in make_batches([text_tuples[i] for i in short], batch_size, token_budget)]
+    else:
+        units = [[i] for i in pending]
+
+    def process(unit, progress=None):
+        try:
+            if len(unit) == 1:
+                data_list = [process_single_text_file(text_tuples[unit[0]], text_inference, silent=silent, log_file=log_file, progress=progress, structured=structured)]
+            else:
+                data_list = process_text_batch([text_tuples[i] for i in unit], text_inference, silent=silent, log_file=log_file, progress=progress, structured=structured)
+        except Exception as e:
+            # Only the files of this unit are lost; the other results are kept
+            for index in unit:
+                file_path = text_tuples[index][0]
+                message = f"Error processing text file {file_path}: {str(e)}"
+                log_message(message, silent, log_file, level='error', path=file_path, stage='describe', error=str(e))
+            return
+        by_path = {data['file_path']: data for data in data_list}
+        for index in unit:
+            data = by_path.get(text_tuples[index][0])
+            if data is None:
+                continue
+            results[index] = data
+            if cache:
+                cache.put(data, model, TEXT_PROMPT_VERSION)
+
+    if max_workers <= 1:
+        for unit in units:
+            process(unit)
+        return [data for data in results if data is not None]
+
+    with Progress(
+        TextColumn("[progress.description]{task.description}"),
+        BarColumn(),
+        TimeElapsedColumn()
+    ) as progress:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            list(executor.map(lambda unit: process(unit, progress), units))
+    return [data for data in results if data is not None]
+
+def generate_batch_text_metadata(contents, text_inference):
+    """Generate metadata for several short documents with one LLM call.
+
+    Returns a list with a (foldername, filename, description) tuple per document, or None
+    for documents without a valid result. Malformed output is retried: if nothing in the
+    response is usable the batch is split in half, otherwise only the missing documents
+    are sent again. A single remaining document is not sent; it is returned as None.
+    """
+    if len(contents) == 1:
+        # A lone document is left to the caller's single-document path (generate_text_metadata),
+        # which makes the structured call itself; calling it here too would repeat the request
+        return [None]
+
+    documents = '\n\n'.join(f"[id: {k + 1}]\n{content[:SHORT_DOCUMENT_CHARS]}" for k, content in enumerate(contents))
+    prompt = f"""Below are {len(contents)} documents, each starting with its [id: N] label. For every document return an object with exactly these keys:
+- "id": the document's id number.
+- "description": a summary of the document in 100 words or less. If it's code, describe its purpose and main components.
+- "filename": a specific and descriptive filename that captures the essence of the document. Maximum of 3 words, nouns only, connected with underscores. Do not start with verbs like 'depicts', 'shows', 'presents', and do not include data type words like 'text', 'document', 'pdf'.
+- "category": a general category or theme that best represents the main subject, used as the folder name. Maximum of 2 words, nouns only. Do not include specific details, words from the filename, or generic terms like 'untitled' or 'unknown'.
+
+Example:
+[{{"id": 1, "description": "A research paper on the fundamentals of string theory.", "filename": "string_theory_fundamentals", "category": "physics"}}]
+
+Output only a JSON array with one object per document, without any additional text.
+
+{documents}"""
+    items = parse_json_array_response(text_inference(prompt))
+
+    results = [None] * len(contents)
+    for item in items or []:
+        try:
+            k = int(item.get('id')) - 1
+        except (TypeError, ValueError):
+            continue
+        values = [item.get(key) for key in ('description', 'filename', 'category')]
+        if 0 <= k < len(contents) and all(isinstance(v, str) and v.strip() for v in values):
+            description, filename, foldername = (v.strip() for v in values)
+            results[k] = (sanitize_filename(foldername, max_words=2), sanitize_filename(filename, max_words=3), description)
+
+    missing = [k for k, result in enumerate(results) if result is None]
+    if not missing:
+        return results
+    if len(missing) == len(contents):
+        middle = len(contents) // 2
+        return (generate_batch_text_metadata(contents[:middle], text_inference)
+                + generate_batch_text_metadata(contents[middle:], text_inference))
+    retried = generate_batch_text_metadata([contents[k] for k in missing], text_inference)
+    for k, result in zip(missing, retried):
+        results[k] = result
     return results
 
-def generate_text_metadata(input_text, file_path, progress, task_id, text_inference):
-    """Generate description, folder name, and filename for a text document."""
+def generate_structured_text_metadata(input_text, text_inference):
+    """Generate description, filename and category for a text document in a single LLM call.
+
+    Returns a (description, filename, foldername) tuple, or None if the response is not valid JSON.
+    """
+    prompt = f"""Read the document content below and return a JSON object with exactly these keys:
+- "description": a summary of the document in 100 words or less. If it's code, describe its purpose and main components.
+- "filename": a specific and descriptive filename that captures the essence of the document. Maximum of 3 words, nouns only, connected with underscores. Do not start with verbs like 'depicts', 'shows', 'presents', and do not include data type words like 'text', 'document', 'pdf'.
+- "category": a general category or theme that best represents the main subject, used as the folder name. Maximum of 2 words, nouns only. Do not include specific details, words from the filename, or generic terms like 'untitled' or 'unknown'.
+
+Example:
+{{"description": "A research paper on the fundamentals of string theory.", "filename": "string_theory_fundamentals", "category": "physics"}}
+
+Output only the JSON object, without any additional text.
+
+Content:
+{input_text[:EXTRACT_CHAR_BUDGET]}"""
+    data = parse_json_response(text_inference(prompt), required_keys=('description', 'filename', 'category'))
+    if data is None:
+        return None
+    return data['description'].strip(), data['filename'].strip(), data['category'].strip()
+
+def generate_text_metadata(input_text, file_path, progress, task_id, text_inference, structured=True):
+    """Generate description, folder name, and filename for a text document.
+
+    In structured mode a single JSON-returning call is tried first; the three-step
+    description/filename/category path is only used when its response cannot be parsed.
+    """
+    if structured:
+        result = generate_structured_text_metadata(input_text, text_inference)
+        if result is not None:
+            description, filename, foldername = result
+            progress.update(task_id, completed=1.0)
+            return sanitize_filename(foldername, max_words=2), sanitize_filename(filename, max_words=3), description
+
     total_steps = 3
 
     # Step 1: Generate description
     description = summarize_text_content(input_text, text_inference)
+    if description is None:
+        raise RuntimeError("no response from the text model")
     progress.update(task_id, advance=1 / total_steps)
 
     # Step 2: Generate filename
@@ -73,7 +312,7 @@ Now generate the filename.
 Output only the filename, without any additional text.
 
 Filename:"""
-    filename = text_inference(filename_prompt)
+    filename = text_inference(filename_prompt) or ''
     filename = re.sub(r'^Filename:\s*', '', filename, flags=re.IGNORECASE).strip()
     progress.update(task_id, advance=1 / total_steps)
 
@@ -96,7 +335,7 @@ Now generate the category.
 Output only the category, without any additional text.
 
 Category:"""
-    foldername = text_inference(foldername_prompt)
+    foldername = text_inference(foldername_prompt) or ''
     foldername = re.sub(r'^Category:\s*', '', foldername, flags=re.IGNORECASE).strip()
     progress.update(task_id, advance=1 / total_steps)
 